@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""How long the scoreboard takes to show a new score, under bad networks
+
+A Sender and _Receiver play simulated matches (see net.simulation) over each
+impairment below. Every score in a scripted match timeline is read by the
+sender at its time, and its convergence latency is from then until the
+receiver's score_writer is called with it. Reported per impairment:
+
+    p50/p95/p99/max - convergence latency in ms, of scores that were shown
+    missed - scores never shown, as the next had arrived before them
+    stale - fraction of the match the display wasn't showing the score
+
+    python benchmarks/convergence.py [--hours H] [--matches N] [--json FILE]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cricket_scorer.misc import my_logger  # noqa: E402
+from cricket_scorer.net import simulation  # noqa: E402
+from cricket_scorer.net.impairment import PRESETS, Impairment  # noqa: E402
+
+IMPAIRMENTS = {
+    "perfect": PRESETS["perfect"],
+    "lan": PRESETS["lan"],
+    "loss_10": PRESETS["lossy"],
+    "loss_30": Impairment(delay_millis=20, jitter_millis=10, loss_good=0.3),
+    # Average burst of 10 datagrams lost, about 9% lost overall
+    "burst_loss": Impairment(delay_millis=20,
+                             jitter_millis=10,
+                             good_to_bad=0.01,
+                             bad_to_good=0.1,
+                             loss_bad=1),
+    "duplicate_reorder": Impairment(delay_millis=20,
+                                    jitter_millis=10,
+                                    duplicate=0.3,
+                                    reorder=0.3,
+                                    reorder_millis=200),
+    "bad_wifi": PRESETS["bad_wifi"],
+    "netem_script": PRESETS["netem_script"],
+}
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[rank]
+
+
+def analyse(timeline, writes, end_millis):
+    """Convergence latencies of the scores shown, how many were never shown,
+    and the total time the display was stale"""
+    latencies = []
+    missed = 0
+    j = 0
+    for i, (millis, score) in enumerate(timeline):
+        next_millis = timeline[i + 1][0] if i + 1 < len(timeline) else end_millis
+        while j < len(writes) and writes[j][0] < millis:
+            j += 1
+        for write_millis, written in writes[j:]:
+            if write_millis >= next_millis:
+                missed += 1
+                break
+            if written == score:
+                latencies.append(write_millis - millis)
+                break
+        else:
+            missed += 1
+
+    # Walk both in time order, the display stale whenever it differs from the
+    # sender's current score
+    events = [(m, 0, s) for m, s in timeline] + [(m, 1, s) for m, s in writes]
+    events.sort(key=lambda e: (e[0], e[1]))
+    wanted = displayed = None
+    stale_millis = 0
+    last = timeline[0][0] if timeline else end_millis
+    for millis, kind, score in events:
+        if millis > end_millis:
+            break
+        if millis >= last and wanted != displayed:
+            stale_millis += millis - last
+        last = max(last, millis)
+        if kind == 0:
+            wanted = score
+        else:
+            displayed = score
+    if wanted != displayed:
+        stale_millis += end_millis - last
+    return latencies, missed, stale_millis
+
+
+def run(hours=3, matches=5, names=None):
+    """Impairment name -> results dict"""
+    log = my_logger.get_logger()
+    old_level, old_handlers = log.level, log.handlers[:]
+    log.setLevel(logging.WARNING)
+    # Corrupt packets are logged as errors, which is expected here
+    log.handlers = [logging.NullHandler()]
+    results = {}
+    try:
+        for name, impairment in IMPAIRMENTS.items():
+            if names and name not in names:
+                continue
+            latencies = []
+            missed = changes = 0
+            stale_millis = match_millis = 0
+            start = time.perf_counter()
+            for seed in range(matches):
+                result = simulation.simulate_match(log,
+                                                   hours=hours,
+                                                   impairment=impairment,
+                                                   seed=seed)
+                end_millis = hours * 3600 * 1000
+                match_latencies, match_missed, match_stale = analyse(
+                    result.timeline, result.writes, end_millis)
+                latencies += match_latencies
+                missed += match_missed
+                changes += len(result.timeline)
+                stale_millis += match_stale
+                match_millis += end_millis - result.timeline[0][0]
+            latencies.sort()
+            results[name] = {
+                "scores": changes,
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "p99": _percentile(latencies, 99),
+                "max": latencies[-1] if latencies else None,
+                "missed": missed,
+                "stale_fraction": stale_millis / match_millis,
+                "seconds": time.perf_counter() - start,
+            }
+    finally:
+        log.setLevel(old_level)
+        log.handlers = old_handlers
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Score convergence latency under bad networks")
+    parser.add_argument("--hours", type=float, default=3, help="Length of each match")
+    parser.add_argument("--matches", type=int, default=5, help="Matches (seeds) per impairment")
+    parser.add_argument("--impairment",
+                        action="append",
+                        choices=list(IMPAIRMENTS),
+                        help="Only run these (may be repeated)")
+    parser.add_argument("--json", metavar="JSON_FILE", help="Also write the results here")
+    parsed_args = parser.parse_args(argv[1:])
+
+    results = run(parsed_args.hours, parsed_args.matches, parsed_args.impairment)
+
+    print(f"{'impairment':<18} {'scores':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} "
+          f"{'missed':>6} {'stale':>7}")
+    for name, r in results.items():
+        latencies = " ".join("{:>8}".format("-" if r[p] is None else f"{r[p]:.0f}")
+                             for p in ("p50", "p95", "p99", "max"))
+        print(f"{name:<18} {r['scores']:>6} {latencies} {r['missed']:>6} "
+              f"{r['stale_fraction']:>7.2%}")
+    print("Latencies in ms of virtual time")
+
+    if parsed_args.json:
+        with open(parsed_args.json, "w") as f:
+            json.dump({"hours": parsed_args.hours, "matches": parsed_args.matches,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
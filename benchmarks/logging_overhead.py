@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Per-packet cost of the sender and receiver paths at INFO and DEBUG levels
+
+A Sender and _Receiver talk over loopback SimpleUDP sockets, the sender
+changing score every iteration (so each iteration is one score packet and one
+echo). Log records go to a real formatter and os.devnull so the cost of
+building messages is included. "eager" is the old LogWrapper behaviour of
+joining the message before checking the level, for comparison.
+
+    python benchmarks/logging_overhead.py [iterations]
+"""
+
+import logging
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cricket_scorer.misc import my_logger  # noqa: E402
+from cricket_scorer.net import connection  # noqa: E402
+from cricket_scorer.net.udp_receive import SimpleUDP  # noqa: E402
+from cricket_scorer.net.utility import int_to_bytes  # noqa: E402
+
+
+class _EagerLogWrapper(my_logger.LogWrapper):
+    """The message is always built, as LogWrapper used to"""
+    def info(self, *args, sep=' ', **kwargs):
+        logging.Logger.info(self, sep.join("{}".format(a) for a in args), **kwargs)
+
+    def debug(self, *args, sep=' ', **kwargs):
+        logging.Logger.debug(self, sep.join("{}".format(a) for a in args), **kwargs)
+
+
+def _make_pair(log):
+    receiver_sock = SimpleUDP(log, 0, host_ip_bind="127.0.0.1")
+    sender_sock = SimpleUDP(log, 0, host_ip_bind="127.0.0.1")
+    receiver = connection._Receiver(
+        types.SimpleNamespace(logger=log,
+                              sock=receiver_sock,
+                              score_writer=lambda score: None,
+                              sender_arbitration="freshness",
+                              sender_priorities=[],
+                              sender_session_timeout_seconds=60,
+                              lookout_timeout_seconds=60))
+    sender = connection.Sender(
+        types.SimpleNamespace(logger=log,
+                              sock=sender_sock,
+                              receiver_ip_port=receiver_sock.socket().getsockname(),
+                              lookout_timeout_seconds=60,
+                              resend_same_countdown_seconds=10,
+                              new_connection_id_countdown_seconds=60,
+                              last_received_timer_seconds=60))
+    return sender, receiver, (sender_sock, receiver_sock)
+
+
+def _exchange(sender, receiver, score):
+    sender.update_score(score)
+    receiver.on_readable()
+    sender.on_readable()
+
+
+def measure(log, iterations):
+    """Returns the mean time per packet in microseconds"""
+    sender, receiver, socks = _make_pair(log)
+    try:
+        for i in range(10):
+            _exchange(sender, receiver, int_to_bytes(i, 9))
+        assert sender.is_connected(), "Sender and receiver failed to connect"
+
+        start = time.perf_counter()
+        for i in range(iterations):
+            _exchange(sender, receiver, int_to_bytes(i + 10, 9))
+        elapsed = time.perf_counter() - start
+    finally:
+        for sock in socks:
+            sock.close()
+    # A score packet and its echo per iteration
+    return elapsed / (2 * iterations) * 1e6
+
+
+def run(iterations=2000):
+    log = my_logger.get_logger()
+    old_class, old_level, old_handlers = log.__class__, log.level, log.handlers[:]
+    devnull = open(os.devnull, "w")
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(my_logger.get_formatter())
+    log.handlers = [handler]
+
+    results = {}
+    try:
+        for logger_class in (my_logger.LogWrapper, _EagerLogWrapper):
+            log.__class__ = logger_class
+            name = "lazy" if logger_class is my_logger.LogWrapper else "eager"
+            for level in (logging.INFO, logging.DEBUG):
+                log.setLevel(level)
+                results[f"{name}_{logging.getLevelName(level).lower()}"] = measure(
+                    log, iterations)
+    finally:
+        log.__class__ = old_class
+        log.setLevel(old_level)
+        log.handlers = old_handlers
+        devnull.close()
+    return results
+
+
+def main(argv):
+    iterations = int(argv[1]) if len(argv) > 1 else 2000
+    for name, micros in run(iterations).items():
+        print(f"{name:<12} {micros:8.1f} us/packet")
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
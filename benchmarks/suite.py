@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Microbenchmarks of the wire format and connection hot paths
+
+Each benchmark is timed with timeit, taking the best of several repeats, and
+reported in nanoseconds per call. Results can be saved as JSON and compared
+against a previously saved run, eg. before and after a change, or between a
+dev box and a Pi:
+
+    python benchmarks/suite.py --save before.json
+    ... make changes ...
+    python benchmarks/suite.py --compare before.json
+
+--filter runs only the benchmarks whose names contain the given string.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cricket_scorer.misc import my_logger  # noqa: E402
+from cricket_scorer.net.packet import Packet  # noqa: E402
+from cricket_scorer.net.sequence_numbers import SequenceNumber  # noqa: E402
+from cricket_scorer.net.utility import int_to_bytes  # noqa: E402
+from cricket_scorer.score_handlers import (score_reader_excel_impl,  # noqa: E402
+                                           score_reader_excel_native, score_reader_xml)
+from cricket_scorer.score_handlers import utils  # noqa: E402
+
+import logging_overhead  # noqa: E402
+
+_INPUT_EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "input_examples")
+
+# Relative change beyond which --compare flags a result
+_SIGNIFICANT_CHANGE = 0.10
+
+
+def _packet_benchmarks():
+    p = Packet(sender=123456,
+               receiver=654321,
+               id_change=42,
+               sequence_number=SequenceNumber(n=1000, bytes_=Packet.SEQUENCE_NUMBER_SIZE),
+               payload=bytes(range(Packet.PAYLOAD_SIZE)))
+    b = bytes(p)
+    view = memoryview(bytearray(b))
+    buf = bytearray(Packet.packet_size())
+    return {
+        "packet_to_bytes": lambda: bytes(p),
+        "packet_pack_into": lambda: p.pack_into(buf),
+        "packet_from_bytes": lambda: Packet.from_bytes(b),
+        "packet_from_memoryview": lambda: Packet.from_bytes(view),
+    }
+
+
+def _sequence_number_benchmarks():
+    a = SequenceNumber(n=2**32 - 5, bytes_=4)
+    b = SequenceNumber(n=3, bytes_=4)
+    counter = SequenceNumber(n=0, bytes_=4)
+    return {
+        "sequence_number_lt": lambda: a < b,
+        "sequence_number_eq": lambda: a == b,
+        "sequence_number_post_increment": counter.post_increment,
+    }
+
+
+def _score_benchmarks():
+    log = my_logger.get_logger()
+    score = bytes([1, 2, 3, 4, 5, 6, 0, 0, 7])
+    return {
+        "int_to_bytes": lambda: int_to_bytes(0x0123456789ABCDEF, 9),
+        "serialise_score_excel": lambda: score_reader_excel_impl._serialise_score(3, "123"),
+        "serialise_score_xml": lambda: score_reader_xml._serialise_score(3, "123"),
+        "sanitise_received_score": lambda: utils.sanitise_received_score(log, score, 9, True),
+    }
+
+
+def _xml_benchmarks():
+    benchmarks = {}
+    for path in sorted(glob.glob(os.path.join(_INPUT_EXAMPLES, "nvplay-*.xml"))):
+        name = os.path.splitext(os.path.basename(path))[0].replace("nvplay-", "")
+        tree = score_reader_xml.read_scores_from_xml(path, streaming=False)
+        assert score_reader_xml.read_scores_from_xml(path, streaming=True) == tree, path
+        benchmarks[f"xml_tree_{name}"] = \
+            lambda path=path: score_reader_xml.read_scores_from_xml(path, streaming=False)
+        benchmarks[f"xml_streaming_{name}"] = \
+            lambda path=path: score_reader_xml.read_scores_from_xml(path, streaming=True)
+    return benchmarks
+
+
+def _workbook_benchmarks():
+    """Decoding the score cells from a workbook file, and reading them when
+    it hasn't changed since"""
+    path = os.path.join(_INPUT_EXAMPLES, "score.xls")
+    cells = ["A2", "B2", "C2", "D2"]
+    wrapper = score_reader_excel_native.SpreadsheetWrapperNative()
+    wrapper.reinit(my_logger.get_logger(), path, "score")
+    return {
+        "workbook_xls_decode":
+        lambda: score_reader_excel_native.read_workbook_cells(path, "score", cells),
+        "workbook_xls_cached": lambda: wrapper.read_cells(cells),
+    }
+
+
+BENCHMARK_GROUPS = [
+    _packet_benchmarks, _sequence_number_benchmarks, _score_benchmarks, _xml_benchmarks,
+    _workbook_benchmarks
+]
+
+
+def _time(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def _time_exchange(repeat, iterations):
+    """One score packet and its echo over loopback between a Sender and a
+    _Receiver, per call"""
+    log = my_logger.get_logger()
+    old_level = log.level
+    log.setLevel(logging.INFO)
+    try:
+        best = min(logging_overhead.measure(log, iterations) for _ in range(repeat))
+    finally:
+        log.setLevel(old_level)
+    # measure is per packet, an exchange is two
+    return best * 2 * 1e3
+
+
+def run(name_filter="", repeat=5, exchange_iterations=2000):
+    """Name -> nanoseconds per call"""
+    # Logging's measured separately by logging_overhead.py
+    log = my_logger.get_logger()
+    old_handlers = log.handlers[:]
+    log.handlers = [logging.NullHandler()]
+    results = {}
+    try:
+        for group in BENCHMARK_GROUPS:
+            for name, func in group().items():
+                if name_filter in name:
+                    results[name] = _time(func, repeat)
+        if name_filter in "loopback_exchange":
+            results["loopback_exchange"] = _time_exchange(repeat, exchange_iterations)
+    finally:
+        log.handlers = old_handlers
+    return results
+
+
+def _environment():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "node": platform.node(),
+    }
+
+
+def compare(results, baseline):
+    """Lines describing each result against the baseline"""
+    lines = []
+    for name, nanos in results.items():
+        base = baseline.get(name)
+        if base is None:
+            lines.append(f"{name:<32} {nanos:12.0f} ns   (not in baseline)")
+            continue
+        change = nanos / base - 1
+        flag = ""
+        if change > _SIGNIFICANT_CHANGE:
+            flag = "  SLOWER"
+        elif change < -_SIGNIFICANT_CHANGE:
+            flag = "  faster"
+        lines.append(f"{name:<32} {nanos:12.0f} ns   was {base:12.0f} ns {change:+7.1%}{flag}")
+    return lines
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run the microbenchmarks")
+    parser.add_argument("--save", metavar="JSON_FILE", help="Write the results here")
+    parser.add_argument("--compare",
+                        metavar="JSON_FILE",
+                        help="Compare against results previously saved with --save")
+    parser.add_argument("--filter", default="", help="Only run benchmarks containing this")
+    parser.add_argument("--repeat", type=int, default=5, help="Take the best of this many runs")
+    parsed_args = parser.parse_args(argv[1:])
+
+    baseline = None
+    if parsed_args.compare:
+        with open(parsed_args.compare) as f:
+            baseline = json.load(f)
+
+    results = run(parsed_args.filter, parsed_args.repeat)
+
+    if baseline is None:
+        for name, nanos in results.items():
+            print(f"{name:<32} {nanos:12.0f} ns")
+    else:
+        if baseline["environment"] != _environment():
+            print("Baseline was from a different environment:", baseline["environment"])
+        print("\n".join(compare(results, baseline["results"])))
+
+    if parsed_args.save:
+        with open(parsed_args.save, "w") as f:
+            json.dump({"environment": _environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
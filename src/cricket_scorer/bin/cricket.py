@@ -4,7 +4,7 @@ import argparse
 import sys
 
 from cricket_scorer.misc import my_logger, profiles
-from cricket_scorer.net import connection, countdown_timer
+from cricket_scorer.net import async_connection, connection, event_loop
 
 
 def main():
@@ -13,6 +13,9 @@ def main():
     parser = argparse.ArgumentParser(allow_abbrev=False)
     #  parser.add_argument("mode", choices = ["sender", "receiver"])
     parser.add_argument("--logs-folder")
+    parser.add_argument("--asyncio",
+                        action="store_true",
+                        help="Run the asyncio implementation of the sender/receiver")
 
     subparsers = parser.add_subparsers(dest="mode")
     subparsers.required = True
@@ -21,6 +24,15 @@ def main():
     sender_parser.add_argument("--profile",
                                choices=sender_profiles.get_buildable_profile_names(),
                                required=True)
+    sender_parser.add_argument("-s",
+                               "--spreadsheet",
+                               help="Spreadsheet or xml file the score's read from, for "
+                               "profiles whose score reader reads one")
+    sender_parser.add_argument("-w", "--worksheet", default="Sheet1")
+    sender_parser.add_argument("--cells",
+                               nargs=4,
+                               metavar=("TOTAL", "WICKETS", "OVERS", "INNINGS"),
+                               default=["A2", "B2", "C2", "D2"])
 
     receiver_parser = subparsers.add_parser("receiver")
     receiver_parser.add_argument("--profile",
@@ -31,8 +43,6 @@ def main():
 
     # I don't understand why argv doesn't go in here, but it doesn't
     #  parsed_args = parser.parse_args()
-    # args = "sender --profile sender_args_excel -s cricket.xlsx -w Sheet1"
-    #  args = "sender --profile sender_args_excel -s cricket.xlsx -w Sheet1".split(" ")
     parsed_args, additional_args = parser.parse_known_args()
 
     log.debug("parsed_args:", parsed_args)
@@ -51,27 +61,66 @@ def main():
             log.info("Initialising args")
             args.init_all()
 
-            sender_connection = connection.Sender(args)
-            timer = countdown_timer.make_countdown_timer(
-                started=True, millis=args.receive_loop_timeout_milliseconds)
+            if parsed_args.spreadsheet is not None:
+                if hasattr(args.score_reader, "refresh_excel"):
+                    args.score_reader.refresh_excel(parsed_args.spreadsheet,
+                                                    parsed_args.worksheet, *parsed_args.cells)
+                elif hasattr(args.score_reader, "refresh_xml"):
+                    args.score_reader.refresh_xml(parsed_args.spreadsheet)
+
+            if parsed_args.asyncio:
+                async_connection.sender_loop(args)
+                return
+
+            sender_connection = connection.make_sender(args)
 
             old_scoredata = None
-            while True:
-                timer.sleep_till_expired()
-                if timer.just_expired():
-                    scoredata = args.score_reader.read_score()
-                    if scoredata != old_scoredata:
-                        args.logger.info("Latest scoredata:", scoredata)
-                        old_scoredata = scoredata
-                    sender_connection.poll(scoredata.score)
-                    timer.reset()
+            stale_retry = None
+
+            def read_score():
+                nonlocal old_scoredata, stale_retry
+                scoredata = args.score_reader.read_score()
+                if scoredata != old_scoredata:
+                    args.logger.info("Latest scoredata:", scoredata)
+                    old_scoredata = scoredata
+                sender_connection.update_score(scoredata.score)
+                if scoredata.stale and (stale_retry is None or stale_retry.cancelled):
+                    # Caught the file part written. A watcher may not fire
+                    # again if it's finished already, so read again shortly
+                    stale_retry = loop.call_later(100, read_score)
+
+            with event_loop.EventLoop(args.logger) as loop:
+                loop.register(args.sock, sender_connection.on_readable)
+                loop.add_timers(sender_connection.next_timeout_millis,
+                                sender_connection.handle_timers)
+                connection.schedule_metrics_summary(args, loop)
+                connection.schedule_journal_sync(args, loop)
+                read_score()
+                watcher = None
+                if hasattr(args.score_reader, "watch"):
+                    watcher = args.score_reader.watch()
+                if watcher is None:
+                    # Zero means read as often as possible, but don't spin
+                    loop.call_every(max(args.receive_loop_timeout_milliseconds, 5), read_score)
+                elif hasattr(watcher, "fileno"):
+                    # Only read when the file's been written
+                    loop.register(watcher, lambda: watcher.changed() and read_score())
+                else:
+                    # The loop already limits polling to poll_interval_millis
+                    loop.call_every(watcher.poll_interval_millis,
+                                    lambda: watcher.poll() and read_score())
+                while True:
+                    loop.run_once()
 
     elif mode == "receiver":
         with receiver_profiles.build_profile(profile_name,
                                              logs_folder=parsed_args.logs_folder) as args:
             log.info("Args:", args)
             args.init_all()
-            connection.receiver_loop(args)
+            if parsed_args.asyncio:
+                async_connection.receiver_loop(args)
+            else:
+                connection.receiver_loop(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+
+from cricket_scorer.net.countdown_timer import monotonic_millis
+
+# Tells a score reader when the file it reads (eg. the NVPlay xml export) has
+# been written, so it's read as soon as it changes and not at all otherwise.
+#
+# On Linux an InotifyWatcher has an fd, readable when the file may have
+# changed, that can be registered with an EventLoop. The directory's watched
+# rather than the file, so writers that replace the file (write a temp file
+# and rename it over) are seen too. Elsewhere a PollingWatcher compares
+# stat_key every poll_interval_millis. Either way changed() says whether the
+# file may have changed since it was last called, without blocking. Something
+# that already calls a PollingWatcher every poll_interval_millis (eg. an
+# EventLoop.call_every) should call poll() instead, which isn't rate limited.
+
+
+def stat_key(path):
+    """Changes whenever the file is written or replaced, None if it's missing"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+_IN_MODIFY = 0x2
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_TO = 0x80
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+# wd, mask, cookie, len then len bytes of (null padded) name
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_LIBC = _load_libc()
+INOTIFY_AVAILABLE = _LIBC is not None
+
+
+class InotifyWatcher:
+    """Watches a file with inotify, see the top of this file"""
+    def __init__(self, path):
+        assert INOTIFY_AVAILABLE
+        self.path = os.path.abspath(path)
+        self._name = os.fsencode(os.path.basename(self.path))
+        self._fd = _LIBC.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, f"inotify_init1: {os.strerror(e)}")
+        wd = _LIBC.inotify_add_watch(
+            self._fd, os.fsencode(os.path.dirname(self.path)),
+            _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_DELETE)
+        if wd < 0:
+            e = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(e, f"inotify_add_watch {os.path.dirname(self.path)}: {os.strerror(e)}")
+
+    def fileno(self):
+        return self._fd
+
+    def changed(self):
+        changed = False
+        while True:
+            try:
+                data = os.read(self._fd, 4096)
+            except BlockingIOError:
+                return changed
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset < len(data):
+                _, mask, _, name_len = _INOTIFY_EVENT.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT.size
+                name = data[offset:offset + name_len].rstrip(b"\0")
+                offset += name_len
+                if name == self._name or mask & _IN_Q_OVERFLOW:
+                    changed = True
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """Watches a file by polling stat_key, see the top of this file"""
+    def __init__(self, path, poll_interval_millis=100, time_now=monotonic_millis):
+        self.path = os.path.abspath(path)
+        self.poll_interval_millis = poll_interval_millis
+        self._time_now = time_now
+        self._key = stat_key(self.path)
+        self._last_poll = time_now()
+
+    def changed(self):
+        """poll(), at most every poll_interval_millis"""
+        now = self._time_now()
+        if now - self._last_poll < self.poll_interval_millis:
+            return False
+        self._last_poll = now
+        return self.poll()
+
+    def poll(self):
+        """Whether the file's changed since the last poll, checked now"""
+        key = stat_key(self.path)
+        if key == self._key:
+            return False
+        self._key = key
+        return True
+
+    def close(self):
+        pass
+
+
+def make_file_watcher(path, log, poll_interval_millis=100):
+    """An InotifyWatcher where possible, else a PollingWatcher"""
+    if INOTIFY_AVAILABLE:
+        try:
+            return InotifyWatcher(path)
+        except OSError as e:
+            log.warning("Can't watch", path, "with inotify, polling it instead:", e)
+    return PollingWatcher(path, poll_interval_millis)
+
+
+def main(argv):
+    import select
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "score.xml")
+        with open(path, "w") as f:
+            f.write("1")
+
+        now = 0
+        polling = PollingWatcher(path, 100, time_now=lambda: now)
+        watchers = [polling]
+        if INOTIFY_AVAILABLE:
+            watchers.append(InotifyWatcher(path))
+        now = 100
+        assert not any(w.changed() for w in watchers)
+
+        with open(os.path.join(folder, "other.xml"), "w") as f:
+            f.write("not this one")
+        now = 200
+        assert not any(w.changed() for w in watchers)
+
+        # Replaced like an exporter writing a temp file then renaming it
+        with open(path + ".tmp", "w") as f:
+            f.write("22")
+        os.replace(path + ".tmp", path)
+        now = 300
+        for w in watchers:
+            if hasattr(w, "fileno"):
+                r, _, _ = select.select([w], [], [], 1)
+                assert r == [w]
+            assert w.changed(), w
+            assert not w.changed(), w
+            w.close()
+
+        # poll isn't limited to every poll_interval_millis
+        with open(path, "w") as f:
+            f.write("333")
+        assert polling.poll()
+        assert not polling.poll()
+        assert not polling.changed()
+        print("Watched with", [type(w).__name__ for w in watchers])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
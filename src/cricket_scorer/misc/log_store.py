@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+import datetime
+import gzip
+import logging
+import os
+import pathlib
+import queue
+import shutil
+import sys
+import threading
+
+from cricket_scorer.misc import my_logger
+
+# Logs folder kept to a fixed size for boxes that run unattended all season.
+#
+# The log is written to segments of up to max_segment_bytes, named by the time
+# they were started so they sort oldest first:
+#   20210501-143000-000.log -> 20210501-143000-000.log.gz once closed
+# Closed segments are compressed by a background thread, and the oldest closed
+# segments deleted whenever the folder is over max_total_bytes.
+#
+# The power is cut without warning whenever the board is switched off, so a
+# segment is compressed to a .tmp file which is fsync'd then renamed over the
+# final name (atomic), and the original only deleted after that. On startup
+# any .tmp files (interrupted compressions) are deleted and any uncompressed
+# closed segments compressed again. At worst a segment is left uncompressed.
+
+_SEGMENT_SUFFIX = ".log"
+_COMPRESSED_SUFFIX = ".log.gz"
+_TMP_SUFFIX = ".tmp"
+
+
+def _fsync_dir(path):
+    # Makes renames/deletes durable. Not possible on Windows, where it's also
+    # less important as the boxes are Pis
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SegmentFileHandler(my_logger.BufferedFileHandler):
+    """Writes to the current segment of a LogStore, starting a new one when it
+    reaches max_segment_bytes
+
+    With autoflush every record is flushed like a plain FileHandler, otherwise
+    a BackgroundWriter is expected to flush it.
+    """
+    def __init__(self, store, *, autoflush=True):
+        self._store = store
+        self._autoflush = autoflush
+        self._segment_bytes = 0
+        self._closed = False
+        super().__init__(store.new_segment_path())
+
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            msg = self.format(record) + self.terminator
+            self.stream.write(msg)
+            if self._autoflush:
+                self.stream.flush()
+        except Exception:
+            self.handleError(record)
+            return
+        # Close enough for mostly ascii logs, and avoids a tell() per record
+        self._segment_bytes += len(msg)
+        if self._segment_bytes >= self._store.max_segment_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        closed_path = self.baseFilename
+        self.stream.flush()
+        os.fsync(self.stream.fileno())
+        self.stream.close()
+        self.baseFilename = self._store.new_segment_path()
+        self.stream = self._open()
+        self._segment_bytes = 0
+        self._store.segment_closed(closed_path)
+
+    def close(self):
+        """Closes the segment and the store, compressing it"""
+        if self._closed:
+            return
+        self._closed = True
+        path = self.baseFilename
+        super().close()
+        self._store.segment_closed(path)
+        self._store.close()
+
+
+class LogStore:
+    """A logs folder of size limited, compressed segments, see the top of this
+    file. Use add_log_store_file_handler to log to one."""
+    def __init__(self, logs_folder, *, max_segment_bytes, max_total_bytes):
+        assert max_segment_bytes < max_total_bytes
+        self.logs_folder = os.path.abspath(logs_folder)
+        self.max_segment_bytes = max_segment_bytes
+        self.max_total_bytes = max_total_bytes
+
+        pathlib.Path(self.logs_folder).mkdir(parents=True, exist_ok=True)
+        self._next_segment = 0
+        self._current_path = None
+        self._lock = threading.Lock()
+        self._to_compress = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="log compressor", daemon=True)
+
+        self._recover()
+        self._thread.start()
+
+    def close(self):
+        """Compresses the segments waiting to be, then stops the thread"""
+        if self._thread.is_alive():
+            self._to_compress.put(None)
+            self._thread.join()
+
+    def _last_index(self, prefix):
+        """Highest index of a segment (in any state) named prefix-<index>, or -1"""
+        last = -1
+        for name in os.listdir(self.logs_folder):
+            index = name[len(prefix) + 1:].split(".", 1)[0]
+            if name.startswith(prefix + "-") and index.isdigit():
+                last = max(last, int(index))
+        return last
+
+    def new_segment_path(self):
+        # An earlier run (eg. if the box restarted within the second) may have
+        # left segments with this timestamp, so carry on after their index
+        # rather than writing to or replacing them
+        prefix = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        index = max(self._next_segment, self._last_index(prefix) + 1)
+        name = "{}-{:03d}{}".format(prefix, index, _SEGMENT_SUFFIX)
+        self._next_segment = index + 1
+        with self._lock:
+            self._current_path = os.path.join(self.logs_folder, name)
+        return self._current_path
+
+    def segment_closed(self, path):
+        self._to_compress.put(path)
+
+    def _paths(self, suffix):
+        return sorted(
+            os.path.join(self.logs_folder, name) for name in os.listdir(self.logs_folder)
+            if name.endswith(suffix))
+
+    def _recover(self):
+        """Tidy up after a power cut, before any segment is open"""
+        for path in self._paths(_TMP_SUFFIX):
+            os.remove(path)
+        for path in self._paths(_SEGMENT_SUFFIX):
+            if os.path.exists(path[:-len(_SEGMENT_SUFFIX)] + _COMPRESSED_SUFFIX):
+                # Compressed but the original wasn't deleted
+                os.remove(path)
+            else:
+                self._to_compress.put(path)
+        _fsync_dir(self.logs_folder)
+
+    def _compress(self, path):
+        if not os.path.exists(path):
+            return
+        final_path = path[:-len(_SEGMENT_SUFFIX)] + _COMPRESSED_SUFFIX
+        tmp_path = final_path + _TMP_SUFFIX
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            with gzip.GzipFile(filename=os.path.basename(path), mode="wb", fileobj=dst) as gz:
+                shutil.copyfileobj(src, gz)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, final_path)
+        _fsync_dir(self.logs_folder)
+        os.remove(path)
+        _fsync_dir(self.logs_folder)
+
+    def enforce_budget(self):
+        """Delete the oldest closed segments until the folder fits in
+        max_total_bytes. The segment being written is never deleted."""
+        with self._lock:
+            current_path = self._current_path
+        segments = sorted(
+            self._paths(_SEGMENT_SUFFIX) + self._paths(_COMPRESSED_SUFFIX),
+            key=os.path.basename)
+        sizes = {}
+        for path in segments:
+            try:
+                sizes[path] = os.path.getsize(path)
+            except OSError:
+                pass
+        total = sum(sizes.values())
+        deleted = False
+        for path in sizes:
+            if total <= self.max_total_bytes:
+                break
+            if path == current_path:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= sizes[path]
+            deleted = True
+        if deleted:
+            _fsync_dir(self.logs_folder)
+
+    def _run(self):
+        self.enforce_budget()
+        while True:
+            path = self._to_compress.get()
+            if path is None:
+                return
+            try:
+                self._compress(path)
+            except OSError as e:
+                my_logger.get_logger().warning("Error compressing log segment", path, ":", e)
+            self.enforce_budget()
+
+
+def add_log_store_file_handler(logs_folder,
+                               *,
+                               max_segment_bytes,
+                               max_total_bytes,
+                               background=False,
+                               writer_options=None):
+    """Like my_logger.add_datetime_file_handler, but logging to a LogStore"""
+    # The old handler's closed first, so its segment isn't still being written
+    # when the new store recovers the folder (compressing any segments in it)
+    my_logger.replace_file_handler(None)
+    store = LogStore(logs_folder,
+                     max_segment_bytes=max_segment_bytes,
+                     max_total_bytes=max_total_bytes)
+    file_h = SegmentFileHandler(store, autoflush=not background)
+    file_h.set_name(store.logs_folder)
+    file_h.setFormatter(my_logger.get_formatter())
+    if background:
+        handler = my_logger.BackgroundFileHandler(file_h, **(writer_options or {}))
+    else:
+        handler = file_h
+    handler.setLevel(logging.DEBUG)
+    return my_logger.replace_file_handler(handler)
+
+
+def main(argv):
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as logs_folder:
+        # Leftovers from a "power cut"
+        pathlib.Path(logs_folder, "20200101-000000-000.log").write_text("old\n" * 1000)
+        pathlib.Path(logs_folder, "20200101-000001-000.log.gz.tmp").write_text("partial")
+
+        log = add_log_store_file_handler(logs_folder,
+                                         max_segment_bytes=20 * 1024,
+                                         max_total_bytes=40 * 1024)
+        for i in range(10000):
+            log.debug("Line number", i, "of a log that fills up the folder")
+
+        def folder():
+            names = sorted(os.listdir(logs_folder))
+            sizes = [os.path.getsize(os.path.join(logs_folder, n)) for n in names]
+            return names, sum(sizes)
+
+        # The compressor fsyncs each segment, so give it a while to catch up
+        for _ in range(200):
+            try:
+                names, total = folder()
+            except FileNotFoundError:
+                # Deleted between listing and getting its size
+                names = []
+            if names and sum(n.endswith(_SEGMENT_SUFFIX) for n in names) == 1 \
+                    and "20200101-000000-000.log" not in names:
+                break
+            time.sleep(0.05)
+        names, total = folder()
+        print(len(names), "files,", total, "bytes:", names[:3], "...", names[-2:])
+        assert not any(n.endswith(_TMP_SUFFIX) for n in names)
+        # Compressed, and deleted as the oldest if the compressed segments
+        # went over budget (depends how far behind the compressor got)
+        assert "20200101-000000-000.log" not in names
+        assert sum(n.endswith(_SEGMENT_SUFFIX) for n in names) == 1
+        assert total <= 40 * 1024 + 20 * 1024
+
+        # Starting again closes the old store, compressing its last segment
+        # whole, and doesn't leave its thread running
+        log.debug("Last line of the first store")
+        log = add_log_store_file_handler(logs_folder,
+                                         max_segment_bytes=20 * 1024,
+                                         max_total_bytes=40 * 1024)
+        log.debug("First line of the second store")
+        compressors = [t for t in threading.enumerate() if t.name == "log compressor"]
+        assert len(compressors) == 1, compressors
+        newest = sorted(n for n in os.listdir(logs_folder) if n.endswith(_COMPRESSED_SUFFIX))[-1]
+        with gzip.open(os.path.join(logs_folder, newest), "rt") as f:
+            assert f.read().endswith("Last line of the first store\n")
+        my_logger.replace_file_handler(None)
+        assert not any(t.name == "log compressor" for t in threading.enumerate())
+
+    # Restarted within the second: segments of the last run aren't reused
+    with tempfile.TemporaryDirectory() as logs_folder:
+        prefix = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        pathlib.Path(logs_folder, prefix + "-000.log.gz").write_bytes(b"")
+        pathlib.Path(logs_folder, prefix + "-004.log").write_text("last run\n")
+        store = LogStore(logs_folder, max_segment_bytes=1024, max_total_bytes=4096)
+        path = os.path.basename(store.new_segment_path())
+        store.close()
+        assert not path.startswith(prefix) or path == prefix + "-005.log", path
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
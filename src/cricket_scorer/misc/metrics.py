@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import http.server
+import json
+import math
+import sys
+import threading
+
+# Counters and histograms of what the connection layer does, so timeouts can
+# be tuned from how the links actually behave.
+#
+# Everything registers with REGISTRY, which can be logged periodically (see
+# add_metrics_log_interval_seconds) and served as JSON over loopback HTTP (see
+# add_metrics_http_port), eg. curl http://127.0.0.1:2580/
+#
+# Updates are a few integer operations and aren't locked: with the GIL the
+# worst a concurrent reader sees is a snapshot that's a moment out of date.
+
+
+class Counter:
+    __slots__ = ("name", "value")
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    """Counts values into logarithmic buckets, each _BUCKETS_PER_DOUBLING to a
+    doubling, so percentiles are accurate to within about 20% whatever the
+    range of values, in constant memory"""
+
+    _BUCKETS_PER_DOUBLING = 4
+
+    __slots__ = ("name", "unit", "count", "sum", "min", "max", "_buckets")
+
+    def __init__(self, name, unit=""):
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        # Bucket index -> count, index None for values <= 0
+        self._buckets = {}
+
+    @classmethod
+    def _bucket(cls, value):
+        if value <= 0:
+            return None
+        return math.floor(math.log2(value) * cls._BUCKETS_PER_DOUBLING)
+
+    @classmethod
+    def _bucket_upper_bound(cls, index):
+        if index is None:
+            return 0
+        return 2**((index + 1) / cls._BUCKETS_PER_DOUBLING)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        index = self._bucket(value)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    def percentile(self, p):
+        """Approximate value below which p percent of values fall, None if
+        nothing's been observed"""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for index in sorted(self._buckets, key=lambda i: -math.inf if i is None else i):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(max(self._bucket_upper_bound(index), self.min), self.max)
+        return self.max
+
+    def snapshot(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "unit": self.unit,
+        }
+
+
+class Registry:
+    """Named counters and histograms. Asking for an existing name returns the
+    existing one."""
+    def __init__(self):
+        self._metrics = {}
+
+    def _get(self, name, metric_type, *args):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = metric_type(name, *args)
+        assert type(metric) is metric_type, f"Metric {name} is a {type(metric).__name__}"
+        return metric
+
+    def counter(self, name):
+        return self._get(name, Counter)
+
+    def histogram(self, name, unit=""):
+        return self._get(name, Histogram, unit)
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+    def summary(self):
+        """One line, for logging"""
+        parts = []
+        for name, value in self.snapshot().items():
+            if isinstance(value, dict):
+                if value["count"]:
+                    value = "n={count} p50={p50:.1f} p99={p99:.1f} max={max:.1f}{unit}".format(
+                        **value)
+                else:
+                    value = "n=0"
+            parts.append(f"{name}: {value}")
+        return ", ".join(parts)
+
+
+REGISTRY = Registry()
+
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(self.server.registry.snapshot(), indent=2).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Not to stderr
+        pass
+
+
+class MetricsServer:
+    """Serves a registry's snapshot as JSON to GET requests on a loopback port,
+    from a background thread"""
+    def __init__(self, log, port, registry=REGISTRY, host="127.0.0.1"):
+        self._log = log
+        self._server = http.server.ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="metrics server",
+                                        daemon=True)
+        self._thread.start()
+        self._log.info("Serving metrics on http://{}:{}/".format(*self._server.server_address))
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main(argv):
+    import urllib.request
+
+    registry = Registry()
+    registry.counter("packets").inc(3)
+    h = registry.histogram("rtt", "ms")
+    for v in range(1, 101):
+        h.observe(v)
+    assert 40 <= h.percentile(50) <= 60, h.percentile(50)
+    assert 80 <= h.percentile(99) <= 100, h.percentile(99)
+    assert h.percentile(100) == 100
+    assert registry.counter("packets") is registry.counter("packets")
+    print(registry.summary())
+
+    class _Log:
+        def info(self, *args):
+            print(*args)
+
+    server = MetricsServer(_Log(), 0, registry)
+    port = server._server.server_address[1]
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/") as response:
+        assert json.load(response)["packets"] == 3
+    server.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,44 +1,88 @@
 import datetime
 import logging
+import logging.handlers
 import os
 import pathlib
+import queue
+import threading
+import time
+
+
+class Lazy:
+    """Log argument that's only computed if the message is actually logged, eg.
+    log.debug("Recvd:", Lazy(hex_string, data))"""
+
+    __slots__ = ("_func", "_args")
+
+    def __init__(self, func, *args):
+        self._func = func
+        self._args = args
+
+    def __str__(self):
+        return str(self._func(*self._args))
+
+
+class _PrintArgs:
+    """A log message that's joined from its print-like args only when a handler
+    formats the record. Joined once, as each handler formats it."""
+
+    __slots__ = ("_args", "_sep", "_joined")
+
+    def __init__(self, args, sep):
+        self._args = args
+        self._sep = sep
+        self._joined = None
+
+    def __str__(self):
+        if self._joined is None:
+            self._joined = self._sep.join("{}".format(a) for a in self._args)
+            self._args = None
+        return self._joined
 
 
 # https://stackoverflow.com/a/39571473/8594193
 # Make logger behave like print (ie. auto convert to string)
+# Nothing is converted to a string unless the level is enabled, and then not
+# until the record is handled, so debug logging on hot paths is cheap when
+# disabled. Keyword arguments (exc_info, extra etc.) are passed through.
 class LogWrapper(logging.Logger):
     def __init__(self, name: str) -> None:
         super().__init__(name)
         self._file_handler = None
 
-    def info(self, *args, sep=' '):
-        super().info(sep.join("{}".format(a) for a in args))
+    def info(self, *args, sep=' ', **kwargs):
+        if self.isEnabledFor(logging.INFO):
+            super().info(_PrintArgs(args, sep), **kwargs)
 
-    def debug(self, *args, sep=' '):
-        super().debug(sep.join("{}".format(a) for a in args))
+    def debug(self, *args, sep=' ', **kwargs):
+        if self.isEnabledFor(logging.DEBUG):
+            super().debug(_PrintArgs(args, sep), **kwargs)
 
-    def warning(self, *args, sep=' '):
-        super().warning(sep.join("{}".format(a) for a in args))
+    def warning(self, *args, sep=' ', **kwargs):
+        if self.isEnabledFor(logging.WARNING):
+            super().warning(_PrintArgs(args, sep), **kwargs)
 
-    def error(self, *args, sep=' '):
-        super().error(sep.join("{}".format(a) for a in args))
+    def error(self, *args, sep=' ', **kwargs):
+        if self.isEnabledFor(logging.ERROR):
+            super().error(_PrintArgs(args, sep), **kwargs)
 
-    def critical(self, *args, sep=' '):
-        super().critical(sep.join("{}".format(a) for a in args))
+    def critical(self, *args, sep=' ', **kwargs):
+        if self.isEnabledFor(logging.CRITICAL):
+            super().critical(_PrintArgs(args, sep), **kwargs)
 
-    def exception(self, *args, sep=' '):
-        super().exception(sep.join("{}".format(a) for a in args))
+    def exception(self, *args, sep=' ', **kwargs):
+        if self.isEnabledFor(logging.ERROR):
+            super().exception(_PrintArgs(args, sep), **kwargs)
 
-    def log(self, *args, sep=' '):
-        super().log(sep.join("{}".format(a) for a in args))
+    def log(self, level, *args, sep=' ', **kwargs):
+        if self.isEnabledFor(level):
+            super().log(level, _PrintArgs(args, sep), **kwargs)
 
 
 # Something to remember, we "may" run into a space issue with logfiles over
-# time (seems unlikely but possible).
-# Consider compressing old files. Take care to make a copy of an old logfile
-# then "atomic" (as can be) mv them over etc. as we lose power via a hard reset
-# whenever the board is switched off in practice, in a similar vein any
-# streaming compression needs to consider this too (don't bother with it).
+# time (seems unlikely but possible). Profiles for boxes that run unattended
+# should use a log_store.LogStore, which rotates, compresses and caps the size
+# of the logs folder.
 
 _LOGGER_NAME = "log"
 
@@ -47,11 +91,13 @@ def get_logger():
     return logging.getLogger(_LOGGER_NAME)
 
 
-def add_datetime_file_handler(logs_folder):
+def add_datetime_file_handler(logs_folder, background=False, writer_options=None):
+    """background: write the logfile from a thread, see BackgroundFileHandler,
+    configured by writer_options (BackgroundWriter keyword args)"""
     logfile_name = datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".log"
     pathlib.Path(logs_folder).mkdir(parents=True, exist_ok=True)
     logfile_path = os.path.join(logs_folder, logfile_name)
-    return _get_file_logger(logfile_path)
+    return _get_file_logger(logfile_path, background, writer_options)
 
 
 # NOTE: Design flaw in the program. The Args struct return by build_profile
@@ -75,14 +121,26 @@ def get_formatter():
     return formatter
 
 
-def _get_file_logger(filename):
+def _get_file_logger(filename, background=False, writer_options=None):
+    if background:
+        return replace_file_handler(_get_background_file_handler(filename, writer_options))
+    return replace_file_handler(_get_file_handler(filename))
+
+
+def replace_file_handler(new_file_handler):
+    """Swap the logger's file handler (or remove it if None), closing the old
+    one (which for a BackgroundFileHandler writes out what's queued)"""
     logger = logging.getLogger(_LOGGER_NAME)
     # For now, can assume only one file handler is present at once
-    file_handlers = [h for h in logger.handlers if isinstance(h, logging.FileHandler)]
-    new_file_handler = _get_file_handler(filename)
+    file_handlers = [
+        h for h in logger.handlers
+        if isinstance(h, (logging.FileHandler, BackgroundFileHandler))
+    ]
     if len(file_handlers) == 1:
         logger.removeHandler(file_handlers[0])
-    logger.addHandler(new_file_handler)
+        file_handlers[0].close()
+    if new_file_handler is not None:
+        logger.addHandler(new_file_handler)
     return logger
 
 
@@ -102,6 +160,150 @@ def _get_file_handler(filename, level=logging.DEBUG):
     return file_h
 
 
+def _get_background_file_handler(filename, writer_options=None, level=logging.DEBUG):
+    file_h = BufferedFileHandler(filename)
+    file_h.set_name(filename)
+    file_h.setFormatter(get_formatter())
+    handler = BackgroundFileHandler(file_h, **(writer_options or {}))
+    handler.setLevel(level)
+    return handler
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """FileHandler that doesn't flush after every record. Something else must
+    call flush (and fsync), see BackgroundWriter"""
+    def __init__(self, filename, mode="a", encoding=None, delay=False,
+                 buffer_bytes=64 * 1024):
+        self._buffer_bytes = buffer_bytes
+        super().__init__(filename, mode, encoding, delay)
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self._buffer_bytes,
+                    encoding=self.encoding)
+
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+    def fsync(self):
+        """Flush and make sure the data is on disk (or SD card)"""
+        with self.lock:
+            if self.stream is not None:
+                self.stream.flush()
+                os.fsync(self.stream.fileno())
+
+
+class BackgroundWriter:
+    """Thread that takes records off a queue and writes them to a
+    BufferedFileHandler in batches. Flushes after flush_records records or
+    flush_interval_seconds, whichever comes first, and fsyncs written data
+    every fsync_interval_seconds, so a slow SD card doesn't hold up the thread
+    doing the logging.
+
+    Something like the last fsync_interval_seconds of logs may be lost on a
+    hard power off, which is how the boards are switched off.
+    """
+
+    _STOP = object()
+
+    def __init__(self,
+                 record_queue,
+                 handler,
+                 *,
+                 flush_records=256,
+                 flush_interval_seconds=1.0,
+                 fsync_interval_seconds=10.0):
+        self._queue = record_queue
+        self._handler = handler
+        self._flush_records = flush_records
+        self._flush_interval_seconds = flush_interval_seconds
+        self._fsync_interval_seconds = fsync_interval_seconds
+        self._thread = threading.Thread(target=self._run, name="log writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Writes everything queued so far then stops the thread"""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def _write(self, record):
+        if self._handler.filter(record):
+            self._handler.handle(record)
+
+    def _run(self):
+        unflushed = 0
+        unsynced = False
+        last_flush = last_fsync = time.monotonic()
+        stopping = False
+        while not stopping:
+            # Wake up for whichever of the flush and fsync is due first, so
+            # written records are fsync'd even if no more are logged
+            now = time.monotonic()
+            waits = []
+            if unflushed:
+                waits.append(self._flush_interval_seconds - (now - last_flush))
+            if unsynced:
+                waits.append(self._fsync_interval_seconds - (now - last_fsync))
+            timeout = max(min(waits), 0) if waits else None
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+            # Take everything else that's waiting in one go
+            while record is not None:
+                if record is self._STOP:
+                    stopping = True
+                    break
+                self._write(record)
+                unflushed += 1
+                if unflushed >= self._flush_records:
+                    break
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    record = None
+
+            now = time.monotonic()
+            if unflushed and (stopping or unflushed >= self._flush_records
+                              or now - last_flush >= self._flush_interval_seconds):
+                self._handler.flush()
+                unflushed = 0
+                unsynced = True
+                last_flush = now
+            if unsynced and (stopping or now - last_fsync >= self._fsync_interval_seconds):
+                try:
+                    self._handler.fsync()
+                except OSError:
+                    pass
+                unsynced = False
+                last_fsync = now
+
+
+class BackgroundFileHandler(logging.handlers.QueueHandler):
+    """Queues records for a BackgroundWriter thread to write to a
+    BufferedFileHandler. Records are formatted on the logging thread (so
+    arguments can't change before they're written) but nothing is written
+    there."""
+    def __init__(self, file_handler, **writer_kwargs):
+        record_queue = queue.SimpleQueue()
+        super().__init__(record_queue)
+        self.file_handler = file_handler
+        self._writer = BackgroundWriter(record_queue, file_handler, **writer_kwargs)
+        self._writer.start()
+
+    def close(self):
+        self._writer.stop()
+        self.file_handler.close()
+        super().close()
+
+
 logging.setLoggerClass(LogWrapper)
 _logger = logging.getLogger(_LOGGER_NAME)
 _logger.setLevel(logging.DEBUG)
@@ -3,8 +3,9 @@ import collections
 import inspect
 import typing
 
-from cricket_scorer.misc import my_logger
-from cricket_scorer.net import udp_receive
+from cricket_scorer.misc import log_store, metrics, my_logger
+from cricket_scorer.net import packet_journal, udp_receive
+from cricket_scorer.net.impairment import ImpairedUDP, get_impairment
 
 from enum import Enum
 
@@ -47,6 +48,24 @@ class BaseProfileBuilder:
                 closing_func=lambda _: my_logger.close_file_handler())
         return self
 
+    def add_background_logging(self, enabled, **writer_options):
+        """Write the logfile (if there is a logs folder) from a background
+        thread, flushing in batches and fsyncing every so often, rather than
+        a blocking write and flush per line. For SD cards.
+
+        writer_options set how often: flush_records, flush_interval_seconds
+        and fsync_interval_seconds, see my_logger.BackgroundWriter."""
+        return _add_entry(self, dict(writer_options) if enabled else False)
+
+    def add_log_store(self, max_segment_bytes, max_total_bytes):
+        """Write the logfile (if there is a logs folder) as segments of up to
+        max_segment_bytes which are compressed once closed, deleting the
+        oldest to keep the folder under max_total_bytes. See LogStore."""
+        return _add_entry(self, {
+            "max_segment_bytes": max_segment_bytes,
+            "max_total_bytes": max_total_bytes
+        })
+
     def add_sock(self, port, host_ip_bind=Parameters.NOT_PROVIDED):
         d = {"server_port": port}
         if host_ip_bind is not Parameters.NOT_PROVIDED:
@@ -56,6 +75,46 @@ class BaseProfileBuilder:
                                         depends_on_logger=True)
         return self
 
+    def add_impaired_sock(self, port, impairment, seed=0, host_ip_bind=Parameters.NOT_PROVIDED):
+        """As add_sock, but sends go through a simulated bad network, see
+        net.impairment. impairment is an Impairment or the name of a preset."""
+        d = {
+            "server_port": port,
+            "impairment": get_impairment(impairment),
+            "seed": seed
+        }
+        if host_ip_bind is not Parameters.NOT_PROVIDED:
+            d["host_ip_bind"] = host_ip_bind
+        self._data["sock"] = ArgWrapper(BuildFuncArgs(ImpairedUDP, d),
+                                        closing_func=lambda sock: sock.close(),
+                                        depends_on_logger=True)
+        return self
+
+    def add_packet_journal(self, journal_folder, flush_interval_seconds=5.0):
+        """Record every packet sent and received in a binary journal file in
+        journal_folder, written out at least every flush_interval_seconds,
+        see packet_journal."""
+        self._data["packet_journal"] = ArgWrapper(
+            BuildFuncArgs(packet_journal.open_datetime_journal, {
+                "journal_folder": journal_folder,
+                "flush_interval_seconds": flush_interval_seconds
+            }),
+            closing_func=lambda journal: journal.close())
+        return self
+
+    def add_metrics_log_interval_seconds(self, s):
+        """Log a one line summary of the connection metrics (packet counts,
+        round trip times etc.) this often."""
+        return _add_entry(self, s)
+
+    def add_metrics_http_port(self, port):
+        """Serve the connection metrics as JSON at http://127.0.0.1:port/"""
+        self._data["metrics_server"] = ArgWrapper(BuildFuncArgs(metrics.MetricsServer,
+                                                                {"port": port}),
+                                                  closing_func=lambda server: server.close(),
+                                                  depends_on_logger=True)
+        return self
+
     def add_lookout_timeout_seconds(self, s):
         """When on and not connected, occasionally send out messages to the
         receiver in case it's come up to alert it that we're switched on."""
@@ -67,6 +126,22 @@ class BaseProfileBuilder:
         return _add_entry(self, t)
 
 
+def _configure_file_logger(profile: BaseProfileBuilder):
+    """Apply the options for how the logfile is written to the logger"""
+    logger = profile._data["logger"]
+    args = dict(logger._builder_func.args)
+    writer_options = profile._simple_data.get("background_logging", False)
+    if writer_options is not False:
+        args["background"] = True
+        args["writer_options"] = writer_options
+    store = profile._simple_data.get("log_store")
+    if store is not None:
+        args.update(store)
+        logger._builder_func = BuildFuncArgs(log_store.add_log_store_file_handler, args)
+    else:
+        logger._builder_func = logger._builder_func._replace(args=args)
+
+
 def _build_profile(profile: BaseProfileBuilder, logs_folder=None, overwrite_if_none=False):
     # Don't mutate the profile object itself, ie. should be able to build the profile
     # as many times as you like without it changing.
@@ -76,6 +151,8 @@ def _build_profile(profile: BaseProfileBuilder, logs_folder=None, overwrite_if_n
 
     if "logger" not in profile._data or profile._data["logger"] is None:
         profile._data["logger"] = ArgWrapper(value=my_logger.get_logger(), is_initialised=True)
+    else:
+        _configure_file_logger(profile)
 
     assert None not in profile._data.values()
 
@@ -102,6 +179,11 @@ class SenderProfileBuilder(BaseProfileBuilder):
     def add_receiver_ip_port(self, ip_port):
         return _add_entry(self, ip_port)
 
+    def add_receiver_ip_ports(self, ip_ports):
+        """Send to every one of these receivers (scoreboards) rather than just
+        receiver_ip_port, see connection.FanOutSender"""
+        return _add_entry(self, list(ip_ports))
+
     def add_score_reader(self, reader):
         self._data["score_reader"] = ArgWrapper(BuildFuncArgs(reader, {}),
                                                 closing_func=lambda reader: reader.close(),
@@ -125,8 +207,10 @@ class SenderProfileBuilder(BaseProfileBuilder):
         return _add_entry(self, s)
 
     def add_resend_same_countdown_seconds(self, s):
-        """We use this to avoid resending the same score again in a short amount
-        of time."""
+        """Initial retransmission timeout: how long to wait for the receiver to
+        echo a score before sending it again. Once round trips have been
+        measured the timeout adapts to them (backing off exponentially on
+        repeated timeouts up to the lookout_timeout), see RttEstimator."""
         return _add_entry(self, s)
 
 
@@ -138,6 +222,23 @@ class ReceiverProfileBuilder(BaseProfileBuilder):
         self._data["score_writer"] = ArgWrapper(BuildFuncArgs(writer, {}), depends_on_logger=True)
         return self
 
+    def add_sender_arbitration(self, rule):
+        """How the receiver picks which of several senders to display, either
+        "freshness" (the one that most recently changed its score) or
+        "priority" (see add_sender_priorities)"""
+        return _add_entry(self, rule)
+
+    def add_sender_priorities(self, ips):
+        """Sender IP addresses, highest priority first, for "priority"
+        sender_arbitration"""
+        return _add_entry(self, list(ips))
+
+    def add_sender_session_timeout_seconds(self, s):
+        """A sender not heard from for this long (connected senders acknowledge
+        lookout messages) no longer counts when choosing which sender to
+        display. Should be a few times the lookout_timeout."""
+        return _add_entry(self, s)
+
 
 class ArgWrapper:
     """Class that holds either a pre-initialised argument like an int, or
@@ -9,7 +9,7 @@ if my_platform.I2C_ENABLED:
                                                score_writer_i2c_mark2,
                                                score_writer_i2c_mark2_single_digit)
 
-from cricket_scorer.score_handlers import score_reader_excel_dummy
+from cricket_scorer.score_handlers import score_reader_excel_dummy, score_reader_excel_native
 if my_platform.EXCEL_ENABLED:
     from cricket_scorer.score_handlers import score_reader_excel
 
@@ -23,8 +23,11 @@ RECEIVER_WIFI_SSID = "CRICKET0"
 RECEIVER_WIFI_PASSWORD = "cricket0"
 
 LOGS_FOLDER_RASPBERRY_PI = "/home/pi/cricket_scorer/logs"
+LOG_SEGMENT_BYTES_RASPBERRY_PI = 4 * 1024 * 1024
+LOGS_TOTAL_BYTES_RASPBERRY_PI = 512 * 1024 * 1024
 RECEIVER_LISTEN_PORT = 2520
 RECEIVER_IP = "192.168.4.1"
+METRICS_HTTP_PORT = 2580
 
 # Relatively unimportant as receiver responds to sender address including port
 SENDER_LISTEN_PORT = 2521
@@ -36,6 +39,10 @@ RECEIVER_PROFILES.add_new_template(
     RECEIVER_PROFILES.get_profile_class()
     .add_receive_loop_timeout_milliseconds(5000)
     .add_sock(RECEIVER_LISTEN_PORT)
+    .add_sender_arbitration("freshness")
+    .add_sender_priorities([])
+    .add_sender_session_timeout_seconds(60)
+    .add_metrics_log_interval_seconds(300)
     )
 
 RECEIVER_PROFILES.add_based_on(
@@ -52,6 +59,9 @@ if my_platform.I2C_ENABLED:
         .add_lookout_timeout_seconds(20)
         .add_score_writer(score_writer_i2c_mark2.ScoreWriterI2cMark2)
         .add_logs_folder(LOGS_FOLDER_RASPBERRY_PI)
+        .add_background_logging(True, flush_interval_seconds=1, fsync_interval_seconds=10)
+        .add_log_store(LOG_SEGMENT_BYTES_RASPBERRY_PI, LOGS_TOTAL_BYTES_RASPBERRY_PI)
+        .add_metrics_http_port(METRICS_HTTP_PORT)
         )
 
     RECEIVER_PROFILES.add_based_on(
@@ -78,6 +88,18 @@ if my_platform.I2C_ENABLED:
         .add_score_writer(score_writer_i2c_mark2_single_digit.ScoreWriterI2cSingleDigit)
         )
 
+RECEIVER_PROFILES.add_based_on(
+    "test_receiver_args_secondary", "test_receiver_args",
+    RECEIVER_PROFILES.get_profile_class()
+    .add_sock(RECEIVER_LISTEN_PORT + 10)
+    )
+
+RECEIVER_PROFILES.add_based_on(
+    "test_receiver_args_bad_wifi", "test_receiver_args",
+    RECEIVER_PROFILES.get_profile_class()
+    .add_impaired_sock(RECEIVER_LISTEN_PORT, "bad_wifi", seed=1)
+    )
+
 # Sender configs
 
 SENDER_PROFILES.add_new(
@@ -95,6 +117,19 @@ SENDER_PROFILES.add_new(
 SENDER_PROFILES.add_based_on("test_sender_args_file_logger", "test_sender_args",
                              SENDER_PROFILES.get_profile_class())
 
+SENDER_PROFILES.add_based_on(
+    "test_sender_args_fan_out", "test_sender_args",
+    SENDER_PROFILES.get_profile_class()
+    .add_receiver_ip_ports([("127.0.0.1", RECEIVER_LISTEN_PORT),
+                            ("127.0.0.1", RECEIVER_LISTEN_PORT + 10)])
+    )
+
+SENDER_PROFILES.add_based_on(
+    "test_sender_args_bad_wifi", "test_sender_args",
+    SENDER_PROFILES.get_profile_class()
+    .add_impaired_sock(SENDER_LISTEN_PORT, "bad_wifi", seed=2)
+    )
+
 SENDER_PROFILES.add_based_on(
     "test_sender_args_ethernet",
     "test_sender_args",
@@ -124,6 +159,7 @@ SENDER_PROFILES.add_new_template(
     .add_resend_same_countdown_seconds(0.5)
     .add_score_reader(None)
     .add_sock(SENDER_LISTEN_PORT)
+    .add_metrics_log_interval_seconds(300)
     )
 
 if my_platform.I2C_ENABLED:
@@ -132,6 +168,7 @@ if my_platform.I2C_ENABLED:
         SENDER_PROFILES.get_profile_class()
         .add_score_reader(score_reader_i2c.ScoreReaderI2c)
         .add_logs_folder(LOGS_FOLDER_RASPBERRY_PI)
+        .add_log_store(LOG_SEGMENT_BYTES_RASPBERRY_PI, LOGS_TOTAL_BYTES_RASPBERRY_PI)
         )
 
     SENDER_PROFILES.add_based_on("test_sender_args_i2c", "sender_args_i2c",
@@ -166,6 +203,20 @@ if my_platform.EXCEL_ENABLED:
         .add_score_reader(score_reader_excel.get_score_reader)
         )
 
+# Reads the saved spreadsheet file rather than through Excel, so runs anywhere
+SENDER_PROFILES.add_based_on(
+    "excel_native", "sender_args_base",
+    SENDER_PROFILES.get_profile_class().add_receive_loop_timeout_milliseconds(0)
+    .add_last_received_timer_seconds(35)
+    .add_score_reader(score_reader_excel_native.get_score_reader)
+    )
+
+if not my_platform.EXCEL_ENABLED:
+    SENDER_PROFILES.add_based_on(
+        "excel_live", "excel_native",
+        SENDER_PROFILES.get_profile_class()
+        )
+
 SENDER_PROFILES.add_based_on(
     "xml_live", "sender_args_base",
     SENDER_PROFILES.get_profile_class().add_receive_loop_timeout_milliseconds(0)
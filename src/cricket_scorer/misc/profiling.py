@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import functools
+import sys
+import time
+
+from cricket_scorer.misc.metrics import Histogram
+
+# Where the time goes, by named section of code.
+#
+# PROFILER is shared by everything and is disabled (costing an attribute check
+# per call) until enable() is called. Sections are timed with
+#   @PROFILER.profile()                 # named after the function
+#   def read_score(self): ...
+#   with PROFILER.section("network poll"): ...
+#   PROFILER.start("loop"); ...; PROFILER.stop("loop")
+
+
+class _NullSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_SECTION = _NullSection()
+
+
+class _Section:
+    """Context manager timing one named section"""
+
+    __slots__ = ("_stats", "_started")
+
+    def __init__(self, stats):
+        self._stats = stats
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stats.observe(time.perf_counter_ns() - self._started)
+
+
+class Profiler:
+    """Call counts, totals and a histogram of durations per named section"""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        # Name -> Histogram of durations in ns
+        self._stats = {}
+        # Name -> perf_counter_ns when started, for start/stop
+        self._started = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        self._stats.clear()
+        self._started.clear()
+
+    def _get_stats(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = Histogram(name, "ns")
+        return stats
+
+    def section(self, name):
+        if not self.enabled:
+            return _NULL_SECTION
+        return _Section(self._get_stats(name))
+
+    def profile(self, name=None):
+        """Decorator timing every call of the function"""
+        def decorator(func):
+            section_name = func.__qualname__ if name is None else name
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._get_stats(section_name).observe(time.perf_counter_ns() - started)
+
+            return wrapper
+
+        return decorator
+
+    def start(self, name):
+        if not self.enabled:
+            return
+        assert name not in self._started, "Must be stopped before starting"
+        self._started[name] = time.perf_counter_ns()
+
+    def stop(self, name):
+        if not self.enabled:
+            return
+        assert name in self._started, "Must be started before stopped"
+        self._get_stats(name).observe(time.perf_counter_ns() - self._started.pop(name))
+
+    def running(self, name):
+        return name in self._started
+
+    def snapshot(self):
+        """Name -> stats dict (durations in ms)"""
+        result = {}
+        for name, stats in self._stats.items():
+            result[name] = {
+                "count": stats.count,
+                "total": stats.sum / 1e6,
+                "min": stats.min / 1e6,
+                "p50": stats.percentile(50) / 1e6,
+                "p99": stats.percentile(99) / 1e6,
+                "max": stats.max / 1e6,
+            }
+        return result
+
+    def summary(self):
+        """List of lines, one per section. Stops any running sections."""
+        for name in list(self._started):
+            self.stop(name)
+        return [
+            "{} -> n={count} total={total:.1f}ms min={min:.3f}ms p50={p50:.3f}ms "
+            "p99={p99:.3f}ms max={max:.3f}ms".format(name, **stats)
+            for name, stats in self.snapshot().items()
+        ]
+
+
+PROFILER = Profiler()
+
+
+def main(argv):
+    p = Profiler(enabled=True)
+
+    @p.profile()
+    def sleepy(seconds):
+        time.sleep(seconds)
+        return seconds
+
+    for _ in range(5):
+        assert sleepy(0.001) == 0.001
+    with p.section("block"):
+        time.sleep(0.002)
+    p.start("started")
+    p.stop("started")
+    p.start("left running")
+
+    snapshot = p.snapshot()
+    assert snapshot["main.<locals>.sleepy"]["count"] == 5
+    assert snapshot["main.<locals>.sleepy"]["min"] >= 1
+    assert snapshot["block"]["count"] == 1
+    print("\n".join(p.summary()))
+    assert not p.running("left running")
+
+    p = Profiler(enabled=False)
+    with p.section("nothing"):
+        pass
+    p.start("nothing")
+    p.stop("nothing")
+    assert p.summary() == []
+
+    n = 100000
+    started = time.perf_counter_ns()
+    for _ in range(n):
+        with PROFILER.section("disabled"):
+            pass
+    print(f"Disabled section: {(time.perf_counter_ns() - started) / n:.0f}ns")
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,217 @@
+"""asyncio versions of the sender and receiver loops
+
+Same state machines (connection.Sender and connection._Receiver) and wire
+format as the polling versions, but datagrams are delivered by an asyncio
+DatagramProtocol as they arrive, timers are loop.call_later handles scheduled
+for exactly when they're next due, and the score reader runs as a task that
+sends score changes as soon as they're read. When idle nothing runs at all.
+
+Score readers and writers are still called directly on the event loop thread,
+so a slow read or I2C write delays the network for its duration, exactly as it
+does in the polling loops.
+"""
+
+import asyncio
+
+from cricket_scorer.misc import metrics
+
+from .connection import _Receiver, make_sender
+from .impairment import ImpairedUDP
+
+
+class _TransportSocket:
+    """Adapts an asyncio DatagramTransport to the parts of the SimpleUDP
+    interface that _BaseConnection uses to send
+
+    If the profile's socket is an ImpairedUDP, sends go through its
+    ImpairedChannel too, delayed datagrams sent by loop.call_later.
+    """
+    def __init__(self, log, sock):
+        self._log = log
+        self._channel = sock.channel if isinstance(sock, ImpairedUDP) else None
+        self.transport = None
+
+    def sendto(self, data, addr):
+        if self._channel is None:
+            return self._send(data, addr)
+        for delay_millis, datagram in self._channel.transmit(data):
+            if delay_millis == 0:
+                self._send(datagram, addr)
+            else:
+                asyncio.get_running_loop().call_later(delay_millis / 1000, self._send, datagram,
+                                                      addr)
+        return True
+
+    def _send(self, data, addr):
+        if self.transport.is_closing():
+            return False
+        try:
+            self.transport.sendto(data, addr)
+            return True
+        except OSError as e:
+            self._log.warning(f"Async transport send error, sending to addr: {addr}: {e}")
+            return False
+
+    def drain(self, num_bytes, *, max_datagrams=None):
+        # Datagrams are pushed to the protocol instead, there's never a backlog
+        return iter(())
+
+
+class _Timer:
+    """Keeps one loop.call_later handle scheduled for when a state machine's
+    timers are next due"""
+    def __init__(self, loop, next_timeout_millis, on_timeout):
+        self._loop = loop
+        self._next_timeout_millis = next_timeout_millis
+        self._on_timeout = on_timeout
+        self._handle = None
+
+    def reschedule(self):
+        self.cancel()
+        millis = self._next_timeout_millis()
+        if millis is not None:
+            self._handle = self._loop.call_later(millis / 1000, self._fire)
+
+    def cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _fire(self):
+        self._handle = None
+        self._on_timeout()
+        self.reschedule()
+
+
+class _ConnectionProtocol(asyncio.DatagramProtocol):
+    """Feeds received datagrams to a Sender or _Receiver and keeps its timers
+    scheduled"""
+    def __init__(self, log, sock, make_state_machine):
+        self._log = log
+        self._sock = sock
+        self._make_state_machine = make_state_machine
+        self.state_machine = None
+        self._timer = None
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self._sock.transport = transport
+        self.state_machine = self._make_state_machine()
+        self._timer = _Timer(asyncio.get_running_loop(), self.state_machine.next_timeout_millis,
+                             self.state_machine.handle_timers)
+        self._timer.reschedule()
+
+    def datagram_received(self, data, addr):
+        self.state_machine.handle_datagram(data, addr)
+        self._timer.reschedule()
+
+    def error_received(self, exc):
+        self._log.warning("Async udp receive error:", exc)
+
+    def connection_lost(self, exc):
+        if self._timer is not None:
+            self._timer.cancel()
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def reschedule_timers(self):
+        self._timer.reschedule()
+
+
+async def _log_metrics(args):
+    """Logs a summary of the metrics every metrics_log_interval_seconds, if the
+    profile sets it"""
+    if not hasattr(args, "metrics_log_interval_seconds"):
+        return
+    while True:
+        await asyncio.sleep(args.metrics_log_interval_seconds)
+        args.logger.info("Metrics:", metrics.REGISTRY.summary())
+
+
+async def _sync_journal(args):
+    """Syncs the packet journal every flush_interval_seconds, if the profile
+    has one"""
+    journal = getattr(args, "packet_journal", None)
+    if journal is None:
+        return
+    while True:
+        await asyncio.sleep(journal.flush_interval_seconds)
+        journal.sync()
+
+
+async def run_sender(args):
+    """Runs the sender until cancelled. The score reader is read every
+    receive_loop_timeout_milliseconds (with a small floor so zero doesn't spin)
+    and changes are sent immediately."""
+    log = args.logger
+    interval = max(args.receive_loop_timeout_milliseconds, 5) / 1000
+
+    scoredata = args.score_reader.read_score()
+    log.info("Latest scoredata:", scoredata)
+
+    sock = _TransportSocket(log, args.sock)
+
+    def create_sender():
+        sender = make_sender(args, sock=sock)
+        sender.update_score(scoredata.score)
+        return sender
+
+    transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: _ConnectionProtocol(log, sock, create_sender), sock=args.sock.socket())
+
+    async def reader():
+        old_scoredata = scoredata
+        while True:
+            await asyncio.sleep(interval)
+            new_scoredata = args.score_reader.read_score()
+            if new_scoredata != old_scoredata:
+                log.info("Latest scoredata:", new_scoredata)
+                old_scoredata = new_scoredata
+                protocol.state_machine.update_score(new_scoredata.score)
+                protocol.reschedule_timers()
+
+    reader_task = asyncio.ensure_future(reader())
+    metrics_task = asyncio.ensure_future(_log_metrics(args))
+    journal_task = asyncio.ensure_future(_sync_journal(args))
+    try:
+        await asyncio.wait([reader_task, protocol.closed], return_when=asyncio.FIRST_COMPLETED)
+        if reader_task.done():
+            # Propagate score reader errors
+            reader_task.result()
+    finally:
+        reader_task.cancel()
+        metrics_task.cancel()
+        journal_task.cancel()
+        transport.close()
+
+
+async def run_receiver(args):
+    """Runs the receiver until cancelled"""
+    log = args.logger
+    log.info("Async receiver started with params", args)
+
+    sock = _TransportSocket(log, args.sock)
+    transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: _ConnectionProtocol(log, sock, lambda: _Receiver(args, sock=sock)),
+        sock=args.sock.socket())
+    metrics_task = asyncio.ensure_future(_log_metrics(args))
+    journal_task = asyncio.ensure_future(_sync_journal(args))
+    try:
+        await protocol.closed
+    finally:
+        metrics_task.cancel()
+        journal_task.cancel()
+        transport.close()
+
+
+def sender_loop(args):
+    asyncio.run(run_sender(args))
+
+
+def receiver_loop(args):
+    log = args.logger
+    try:
+        asyncio.run(run_receiver(args))
+    except Exception as e:
+        log.error("Exception raised:", str(e))
+        raise
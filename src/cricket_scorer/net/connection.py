@@ -1,8 +1,30 @@
+from cricket_scorer.misc import metrics
+from cricket_scorer.misc.profiling import PROFILER
+
 from .udp_receive import SimpleUDP
 from .sequence_numbers import SequenceNumber
 from .packet import Packet
 from .utility import gen_random, int_to_bytes, probability
-from .countdown_timer import make_countdown_timer
+from .countdown_timer import make_countdown_timer, monotonic_millis
+from .event_loop import EventLoop
+from .packet_journal import RECEIVED, SENT
+from .rtt_estimator import RttEstimator
+
+_PACKETS_IN = metrics.REGISTRY.counter("packets_in")
+_PACKETS_OUT = metrics.REGISTRY.counter("packets_out")
+_SEND_FAILURES = metrics.REGISTRY.counter("send_failures")
+_WRONG_SIZE_DROPS = metrics.REGISTRY.counter("wrong_size_drops")
+_OLD_DUPLICATE_PACKETS = metrics.REGISTRY.counter("old_duplicate_packets")
+_ID_CHANGE_HANDSHAKES = metrics.REGISTRY.counter("id_change_handshakes")
+_SENDER_DISCONNECTS = metrics.REGISTRY.counter("sender_disconnects")
+_RETRANSMITS = metrics.REGISTRY.counter("retransmits")
+_LOOKOUTS_SENT = metrics.REGISTRY.counter("lookouts_sent")
+_SESSIONS_EXPIRED = metrics.REGISTRY.counter("sender_sessions_expired")
+_ACTIVE_SENDER_CHANGES = metrics.REGISTRY.counter("active_sender_changes")
+_RTT_MS = metrics.REGISTRY.histogram("rtt", "ms")
+# From a new score first being sent to it being echoed back
+_SCORE_ECHO_LATENCY_MS = metrics.REGISTRY.histogram("score_echo_latency", "ms")
+_SCORE_WRITE_MS = metrics.REGISTRY.histogram("score_write", "ms")
 
 # class BaseConnection:
 #     sock
@@ -37,13 +59,21 @@ class _BaseConnection:
     functions in this file, although currently the only one mutated not by a
     method is next_remote_seq. Struct like.
     """
+
+    # Wi-Fi delay varies a lot, don't retransmit much faster than this however
+    # quick and consistent the link has been
+    _MIN_RTO_MILLIS = 100
+
     def __init__(self,
                  sock,
                  log,
                  my_id=None,
                  rx_id=Packet.UNKNOWN_ID,
                  next_remote_seq=SequenceNumber(bytes_=Packet.SEQUENCE_NUMBER_SIZE),
-                 next_local_seq=SequenceNumber(bytes_=Packet.SEQUENCE_NUMBER_SIZE)):
+                 next_local_seq=SequenceNumber(bytes_=Packet.SEQUENCE_NUMBER_SIZE),
+                 initial_rto_millis=500,
+                 max_rto_millis=10000,
+                 journal=None):
         if my_id is None:
             my_id = gen_random(Packet.ID_SIZE, excluding=Packet.UNKNOWN_ID)
 
@@ -53,13 +83,41 @@ class _BaseConnection:
         self.next_remote_seq = next_remote_seq
         self.next_local_seq = next_local_seq
         self.log = log
+        # Round trip time to the remote end. Not reset with the ids/sequence
+        # numbers as it's a property of the network path
+        self.rtt = RttEstimator(initial_rto_millis=initial_rto_millis,
+                                min_rto_millis=min(self._MIN_RTO_MILLIS, max_rto_millis),
+                                max_rto_millis=max_rto_millis)
+
+        # Every outgoing packet is packed into this rather than allocating
+        self._send_buffer = bytearray(Packet.packet_size())
+        # Optional PacketJournal recording every packet sent and received
+        self.journal = journal
 
     def recvfrom(self, timeout_ms):
-        data, addr = self.sock.recvfrom(Packet.packet_size(), timeout_ms=timeout_ms)
+        data, addr = self.sock.recvfrom_view(Packet.packet_size(), timeout_ms=timeout_ms)
+        return self._decode(data, addr)
+
+    def recv_batch(self, max_packets=None):
+        """Generator decoding every packet already queued on the socket, see
+        SimpleUDP.drain. Never blocks."""
+        for data, addr in self.sock.drain(Packet.packet_size(), max_datagrams=max_packets):
+            packet, addr = self._decode(data, addr)
+            if packet is not None:
+                yield packet, addr
+
+    def _decode(self, data, addr):
+        """data is a bytes-like object (usually a view into the socket's receive
+        buffer) which is decoded straight into a Packet"""
         if data is not None and len(data) != Packet.packet_size():
+            _WRONG_SIZE_DROPS.inc()
             self.log.error(f"Received wrong packet size, "
-                           "logging and discarding. Packet: {data}")
+                           f"logging and discarding. Packet: {bytes(data)}")
             return None, None
+        if data is not None:
+            _PACKETS_IN.inc()
+            if self.journal is not None:
+                self.journal.record(RECEIVED, addr, data)
         return Packet.from_bytes(data), addr
 
     def sendto(self, payload, addr):
@@ -69,7 +127,7 @@ class _BaseConnection:
                         sequence_number=self.next_local_seq.post_increment(),
                         payload=payload)
         self.log.debug("Sending packet:", packet, "to", addr)
-        return self.sock.sendto(packet.__bytes__(), addr)
+        return self._send_packet(packet, addr)
 
     # Sender only
     def send_id_change_response(self, id_change_packet, new_rx_id, addr):
@@ -78,7 +136,7 @@ class _BaseConnection:
                         id_change=new_rx_id,
                         payload=int_to_bytes(-1, Packet.PAYLOAD_SIZE))
         self.log.debug("Sending:", packet, "to", addr)
-        return self.sock.sendto(packet.__bytes__(), addr)
+        return self._send_packet(packet, addr)
 
     # Receiver only
     def change_and_send_connection_change(self, id_change_packet, addr):
@@ -89,7 +147,17 @@ class _BaseConnection:
                         id_change=old_my_id,
                         payload=int_to_bytes(-1, Packet.PAYLOAD_SIZE))
         self.log.debug("Sending:", packet, "to", addr)
-        return self.sock.sendto(packet.__bytes__(), addr)
+        return self._send_packet(packet, addr)
+
+    def _send_packet(self, packet, addr):
+        packet.pack_into(self._send_buffer)
+        if self.journal is not None:
+            self.journal.record(SENT, addr, self._send_buffer)
+        _PACKETS_OUT.inc()
+        if not self.sock.sendto(self._send_buffer, addr):
+            _SEND_FAILURES.inc()
+            return False
+        return True
 
     def reset(self, *, my_id=None, rx_id=Packet.UNKNOWN_ID):
         if my_id is not None:
@@ -100,46 +168,109 @@ class _BaseConnection:
 
 
 class Sender:
-    def __init__(self, args):
+    # Upper bound on the number of queued packets processed in one poll
+    _MAX_PACKETS_PER_POLL = 64
+
+    def __init__(self, args, sock=None, receiver_ip_port=None, time_now=monotonic_millis):
+        """sock defaults to args.sock, anything with SimpleUDP's sendto and
+        drain will do (see async_connection). receiver_ip_port defaults to
+        args.receiver_ip_port. time_now is the clock timers run on, see
+        VirtualClock."""
         self._log = args.logger
+        self._time_now = time_now
 
         self._log.debug(f"Sender started with params:\n{args}")
 
-        self._sock: SimpleUDP = args.sock
+        self._sock: SimpleUDP = args.sock if sock is None else sock
 
         self._log.debug("Initialising connection object")
-        self._conn = _BaseConnection(self._sock, self._log)
+        # Retransmission timeouts start at resend_same_countdown_seconds, then
+        # follow the measured round trip time, and back off up to the
+        # lookout_timeout
+        self._max_interval_millis = args.lookout_timeout_seconds * 1000
+        self._conn = _BaseConnection(self._sock,
+                                     self._log,
+                                     initial_rto_millis=args.resend_same_countdown_seconds * 1000,
+                                     max_rto_millis=self._max_interval_millis,
+                                     journal=getattr(args, "packet_journal", None))
 
         self._new_rx_id = Packet.UNKNOWN_ID
 
-        self._lookout_timer = make_countdown_timer(seconds=args.lookout_timeout_seconds,
-                                                   started=True)
+        # When not connected, lookout messages are sent starting every RTO and
+        # backing off exponentially to every lookout_timeout
+        self._lookout_interval_millis = self._conn.rtt.rto_millis()
+        self._lookout_timer = make_countdown_timer(millis=self._lookout_interval_millis,
+                                                   started=True,
+                                                   time_now=time_now)
 
         self._new_connection_id_countdown = make_countdown_timer(
-            seconds=args.new_connection_id_countdown_seconds, started=False)
+            seconds=args.new_connection_id_countdown_seconds, started=False, time_now=time_now)
 
         self._last_received_timer = make_countdown_timer(seconds=args.last_received_timer_seconds,
-                                                         started=False)
+                                                         started=False,
+                                                         time_now=time_now)
         self._connected = False
 
-        self._resend_same_countdown = make_countdown_timer(
-            seconds=args.resend_same_countdown_seconds, started=True)
+        # Armed with the RTO whenever the score is sent while connected, and
+        # stopped when the receiver echoes it back
+        self._retransmit_timer = make_countdown_timer(millis=self._conn.rtt.rto_millis(),
+                                                      started=False,
+                                                      time_now=time_now)
+        # The score awaiting an echo, when it was first sent and whether it's
+        # been sent more than once (if so its round trip can't be measured)
+        self._unacked_payload = None
+        self._unacked_sent_millis = None
+        self._retransmitted = False
 
         self._last_payload_sent = None
 
         self._score = None
 
-        self._receiver_ip_port = args.receiver_ip_port
+        self._receiver_ip_port = args.receiver_ip_port if receiver_ip_port is None \
+            else receiver_ip_port
 
     def is_connected(self):
         return self._connected
 
+    def connection_statuses(self):
+        """Dict of receiver address to whether it's connected"""
+        return {self._receiver_ip_port: self._connected}
+
     def _send(self):
         assert self._score is not None, "Must poll before sending score"
         self._log.debug("Sending score:", Packet.payload_as_string(self._score))
         self._conn.sendto(self._score, self._receiver_ip_port)
         self._last_payload_sent = self._score
 
+        if self._unacked_payload != self._score:
+            self._unacked_payload = self._score
+            self._unacked_sent_millis = self._time_now()
+            self._retransmitted = False
+        else:
+            self._retransmitted = True
+        if self._connected:
+            self._retransmit_timer.reset(millis=self._conn.rtt.rto_millis())
+
+    def _on_score_acked(self):
+        """Returns whether this was the echo of a score awaiting one"""
+        if self._unacked_payload != self._score:
+            return False
+        latency_millis = self._time_now() - self._unacked_sent_millis
+        _SCORE_ECHO_LATENCY_MS.observe(latency_millis)
+        if not self._retransmitted:
+            _RTT_MS.observe(latency_millis)
+            self._conn.rtt.add_sample(latency_millis)
+            self._log.debug("Round trip time:", self._conn.rtt)
+        self._conn.rtt.reset_backoff()
+        self._unacked_payload = None
+        self._retransmit_timer.stop()
+        return True
+
+    def _reset_lookout_backoff(self):
+        self._lookout_interval_millis = self._conn.rtt.rto_millis()
+        self._lookout_timer.reset(millis=self._lookout_interval_millis)
+
+    @PROFILER.profile()
     def poll(self, score: bytes):
         """Process incoming packets, update the connection with the latest score
 
@@ -147,6 +278,12 @@ class Sender:
         queued incoming packets as required, send new score out if connected,
         send lookout messages if timeout has expired if not.
         """
+        self.update_score(score)
+        self.handle_timers()
+        self.on_readable()
+
+    def update_score(self, score: bytes):
+        """Sends the score straight away if it has changed"""
         if self._score != score:
             old_score = self._score
             self._score = score
@@ -157,44 +294,71 @@ class Sender:
                 "to", Packet.payload_as_string(self._score), "- sending new score")
             self._send()
             self._last_payload_sent = self._score
-            self._lookout_timer.reset()
+            self._reset_lookout_backoff()
 
-        # Add timeout in case, highly unlikely it would ever be needed, but
+    def on_readable(self):
+        """Handle every queued packet. Called by poll, or directly when the
+        socket is registered with an EventLoop"""
+        # Bound the batch in case, highly unlikely it would ever be needed, but
         # don't want to get stuck looping here forever and the gui to block
-        timeout = make_countdown_timer(millis=300, started=True)
-        while self._poll() and not timeout.just_expired():
-            pass
-
-    def _poll(self):
-        packet, addr = self._conn.recvfrom(timeout_ms=5)
-        if addr is not None and addr != self._receiver_ip_port:
-            self._log.warning("Received packet from", addr, "- expected", self._receiver_ip_port)
+        for packet, addr in self._conn.recv_batch(max_packets=self._MAX_PACKETS_PER_POLL):
+            self._handle_packet(packet, addr)
 
+    def handle_datagram(self, data, addr):
+        """For when datagrams are delivered rather than read from the socket"""
+        packet, addr = self._conn._decode(data, addr)
         if packet is not None:
-            self._log.debug("Received:", packet, "from", addr)
-
-        # Read score would have been here
-
+            self._handle_packet(packet, addr)
+
+    def next_timeout_millis(self):
+        """Time until handle_timers next needs calling, or None"""
+        remaining = [
+            t.remaining_millis() for t in (self._lookout_timer, self._new_connection_id_countdown,
+                                           self._last_received_timer, self._retransmit_timer)
+        ]
+        remaining = [r for r in remaining if r is not None]
+        return min(remaining) if remaining else None
+
+    def handle_timers(self):
         if self._new_connection_id_countdown.just_expired():
             self._log.debug("New connection reply window expired, resetting new_rx_id")
             self._new_rx_id = Packet.UNKNOWN_ID
         if self._last_received_timer.just_expired():
             self._log.debug("Disconnected, received no lookout message in last_received_time")
+            if self._connected:
+                _SENDER_DISCONNECTS.inc()
             self._connected = False
             # Reset everything
             self._conn.reset()
             self._new_rx_id = Packet.UNKNOWN_ID
+            self._retransmit_timer.stop()
+            self._unacked_payload = None
+            self._reset_lookout_backoff()
+
+        if self._retransmit_timer.just_expired() and self._connected:
+            _RETRANSMITS.inc()
+            self._conn.rtt.back_off()
+            self._log.debug("No echo of score within timeout, retransmitting. Round trip time:",
+                            self._conn.rtt)
+            self._send()
 
         if self._connected:
-            self._lookout_timer.reset()
+            self._lookout_timer.stop()
         elif self._lookout_timer.just_expired():
             self._log.debug("Sending lookout message")
+            _LOOKOUTS_SENT.inc()
             self._send()
-            self._lookout_timer.reset()
+            self._lookout_interval_millis = min(self._lookout_interval_millis * 2,
+                                                self._max_interval_millis)
+            self._lookout_timer.reset(millis=self._lookout_interval_millis)
+
+    def _handle_packet(self, packet, addr):
+        if addr != self._receiver_ip_port:
+            self._log.warning("Received packet from", addr, "- expected", self._receiver_ip_port)
 
-        if packet is None:
-            pass
-        elif packet.sender == self._conn.rx_id \
+        self._log.debug("Received:", packet, "from", addr)
+
+        if packet.sender == self._conn.rx_id \
                 and packet.receiver == self._conn.my_id:
             if packet.sequence_number >= self._conn.next_remote_seq:
                 self._last_received_timer.reset()
@@ -205,16 +369,22 @@ class Sender:
                     assert type(packet.payload) is bytes and \
                             len(packet.payload) == Packet.PAYLOAD_SIZE
                     if self._score != self._last_payload_sent or \
-                            self._resend_same_countdown.just_expired():
+                            self._retransmit_timer.remaining_millis() is None:
                         self._log.debug("Sending response data packet with new "
                                         "score", Packet.payload_as_string(self._score))
                         self._send()
                         self._last_payload_sent = self._score
-                        self._resend_same_countdown.reset()
                     else:
-                        self._log.debug("Not sending updated score as would be "
-                                        "duplicate within timeout")
+                        self._log.debug("Not sending updated score as a retransmit is "
+                                        "already scheduled")
+                elif not self._on_score_acked():
+                    # Acknowledge (eg. a lookout message) so a receiver tracking
+                    # several senders knows this one is still here. The
+                    # receiver doesn't reply to a score it already has.
+                    self._log.debug("Acknowledging packet with correct score")
+                    self._conn.sendto(self._score, self._receiver_ip_port)
             else:
+                _OLD_DUPLICATE_PACKETS.inc()
                 self._log.debug("Got old/duplicate packet")
 
         elif packet.sender == self._new_rx_id \
@@ -223,10 +393,11 @@ class Sender:
             self._conn.reset(rx_id=self._new_rx_id)
             self._new_rx_id = Packet.UNKNOWN_ID
             self._new_connection_id_countdown.stop()
+            _ID_CHANGE_HANDSHAKES.inc()
             self._log.debug("Switching connection - new receiver:", self._conn.rx_id,
                             "and sending score")
-            self._send()
             self._connected = True
+            self._send()
             self._last_received_timer.reset()
             self._last_payload_sent = None
 
@@ -240,7 +411,98 @@ class Sender:
             self._conn.send_id_change_response(packet, self._new_rx_id, self._receiver_ip_port)
             self._last_payload_sent = None
 
-        return packet is not None
+
+
+class FanOutSender:
+    """One sender driving several receivers (eg. a main scoreboard and
+    secondary boards) from a single score reader and socket.
+
+    Keeps a Sender per receiver address, so each receiver has its own ids,
+    sequence numbers, timers and connected state, and routes incoming packets
+    to it by source address. Has the same interface as Sender.
+    """
+    # Upper bound on the number of queued packets processed in one poll
+    _MAX_PACKETS_PER_POLL = 64
+
+    def __init__(self, args, sock=None, time_now=monotonic_millis):
+        self._log = args.logger
+        self._sock = args.sock if sock is None else sock
+
+        receiver_ip_ports = [tuple(ip_port) for ip_port in args.receiver_ip_ports]
+        assert len(set(receiver_ip_ports)) == len(receiver_ip_ports), \
+            f"Duplicate receiver addresses in {receiver_ip_ports}"
+        self._log.debug("Fan out sender to receivers:", receiver_ip_ports)
+        self._senders = {
+            ip_port: Sender(args, sock=self._sock, receiver_ip_port=ip_port, time_now=time_now)
+            for ip_port in receiver_ip_ports
+        }
+        self._journal = getattr(args, "packet_journal", None)
+        # Only used to read and decode packets, which are then handed to the
+        # Sender for the address they came from
+        self._receive_conn = _BaseConnection(self._sock, self._log, journal=self._journal)
+        self._statuses = self.connection_statuses()
+
+    def is_connected(self):
+        """True if connected to any of the receivers"""
+        return any(sender.is_connected() for sender in self._senders.values())
+
+    def connection_statuses(self):
+        return {ip_port: sender.is_connected() for ip_port, sender in self._senders.items()}
+
+    @PROFILER.profile()
+    def poll(self, score: bytes):
+        self.update_score(score)
+        self.handle_timers()
+        self.on_readable()
+
+    def update_score(self, score: bytes):
+        for sender in self._senders.values():
+            sender.update_score(score)
+
+    def handle_timers(self):
+        for sender in self._senders.values():
+            sender.handle_timers()
+        self._log_status_changes()
+
+    def next_timeout_millis(self):
+        remaining = [sender.next_timeout_millis() for sender in self._senders.values()]
+        remaining = [r for r in remaining if r is not None]
+        return min(remaining) if remaining else None
+
+    def on_readable(self):
+        for packet, addr in self._receive_conn.recv_batch(max_packets=self._MAX_PACKETS_PER_POLL):
+            self._route(packet, addr)
+        self._log_status_changes()
+
+    def handle_datagram(self, data, addr):
+        packet, addr = self._receive_conn._decode(data, addr)
+        if packet is not None:
+            self._route(packet, addr)
+            self._log_status_changes()
+
+    def _route(self, packet, addr):
+        sender = self._senders.get(addr)
+        if sender is None:
+            self._log.warning("Discarding packet from unknown receiver", addr, "- expected one of",
+                              list(self._senders))
+            return
+        sender._handle_packet(packet, addr)
+
+    def _log_status_changes(self):
+        statuses = self.connection_statuses()
+        if statuses != self._statuses:
+            for ip_port, connected in statuses.items():
+                if connected != self._statuses[ip_port]:
+                    self._log.info("Receiver", ip_port, "connected" if connected else "disconnected")
+            self._statuses = statuses
+
+
+def make_sender(args, sock=None, time_now=monotonic_millis):
+    """A FanOutSender if the profile lists several receiver_ip_ports, else a
+    Sender for its receiver_ip_port"""
+    if hasattr(args, "receiver_ip_ports"):
+        return FanOutSender(args, sock=sock, time_now=time_now)
+    return Sender(args, sock=sock, time_now=time_now)
 
 
 def receiver_loop(args):
@@ -255,69 +517,259 @@ def receiver_loop(args):
         raise
 
 
+def schedule_metrics_summary(args, loop):
+    """Log a summary of the metrics every metrics_log_interval_seconds, if the
+    profile sets it"""
+    if hasattr(args, "metrics_log_interval_seconds"):
+        loop.call_every(args.metrics_log_interval_seconds * 1000,
+                        lambda: args.logger.info("Metrics:", metrics.REGISTRY.summary()))
+
+
+def schedule_journal_sync(args, loop):
+    """Sync the packet journal every flush_interval_seconds, if the profile
+    has one, so it's written out even when no packets are. Returns the
+    handle, or None."""
+    journal = getattr(args, "packet_journal", None)
+    if journal is None:
+        return None
+    return loop.call_every(journal.flush_interval_seconds * 1000, journal.sync)
+
+
 def receiver_loop_impl(args):
-    sock, log = args.sock, args.logger
+    log = args.logger
 
-    log.debug("Initialising connection object")
-    conn = _BaseConnection(sock, log)
+    log.debug("Initialising receiver")
+    receiver = _Receiver(args)
 
-    lookout_timeout = make_countdown_timer(seconds=args.lookout_timeout_seconds, started=True)
-    score = bytes(Packet.PAYLOAD_SIZE)
-    client_addr = None
+    with EventLoop(log) as loop:
+        loop.register(args.sock, receiver.on_readable)
+        loop.add_timers(receiver.next_timeout_millis, receiver.handle_timers)
+        schedule_metrics_summary(args, loop)
+        schedule_journal_sync(args, loop)
+        while True:
+            loop.run_once()
 
-    log.debug("Initialising I2C writer")
 
-    while True:
-        #  log.debug("--")
-        packet, addr = conn.recvfrom(timeout_ms=args.receive_loop_timeout_milliseconds)
+class _SenderSession:
+    """One sender box the receiver is talking to. Struct like.
 
-        if packet is None:
-            if lookout_timeout.just_expired():
-                log.debug("Nothing received and lookout timeout expired, " "resetting it")
-                lookout_timeout.reset()
-                if client_addr is not None:
-                    log.info("Sending lookout message to", client_addr)
-                    conn.sendto(score, client_addr)
-                else:
-                    log.debug("Not sending lookout message as no client " "address")
-        else:
-            log.info("Received packet:", packet, "from", addr)
-            if addr != client_addr:
-                log.info("Packet is from new address:", addr, "- old address was:", client_addr)
+    Each session has its own connection (ids and sequence numbers), so a sender
+    (re)connecting only ever changes its own session.
+    """
+    def __init__(self, conn, addr, timeout_seconds, time_now):
+        self.conn = conn
+        self.addr = addr
+        # Last score received from this sender, None until it sends one
+        self.score = None
+        # Ordering of the last time this sender changed its score, 0 if it
+        # hasn't since connecting (so a sender coming up isn't "fresh")
+        self.last_change = 0
+        self.alive = True
+        self.timer = make_countdown_timer(seconds=timeout_seconds, started=True, time_now=time_now)
+
+
+class _Receiver:
+    """Receiver state machine. Holds a small table of sender sessions keyed by
+    address and the score currently displayed, and is driven by an EventLoop
+    calling on_readable, and handle_timers when next_timeout_millis is up.
+
+    Only the active session's score is displayed. The active session is chosen
+    from those alive (heard from within sender_session_timeout_seconds) by
+    sender_arbitration:
+        "freshness" - whichever sender most recently changed its score, the
+            current one keeping it on a tie
+        "priority" - the first of sender_priorities (a list of IPs) that is
+            alive, unlisted senders after them, then by freshness
+    If no session is alive the last active one stays displayed. Other sessions
+    get their own score echoed back, so they're satisfied and stay quiet rather
+    than resending or reconnecting.
+    """
+
+    # Upper bound on the number of queued packets processed per readable event
+    _MAX_PACKETS_PER_READ = 64
+
+    _MAX_SESSIONS = 4
+
+    _ARBITRATION_RULES = ("freshness", "priority")
+
+    def __init__(self, args, sock=None, time_now=monotonic_millis):
+        self._log = args.logger
+        self._time_now = time_now
+
+        self._sock = args.sock if sock is None else sock
+        self._score_writer = args.score_writer
+
+        self._arbitration = args.sender_arbitration
+        assert self._arbitration in self._ARBITRATION_RULES, \
+            f"sender_arbitration must be one of {self._ARBITRATION_RULES}"
+        self._priorities = list(args.sender_priorities)
+        self._session_timeout_seconds = args.sender_session_timeout_seconds
 
-        if packet is None:
-            pass
-        elif packet.sender == conn.rx_id \
+        self._lookout_timer = make_countdown_timer(seconds=args.lookout_timeout_seconds,
+                                                  started=True,
+                                                  time_now=time_now)
+        self._score = bytes(Packet.PAYLOAD_SIZE)
+
+        self._journal = getattr(args, "packet_journal", None)
+        # Only used to read and decode packets, which are then handled by the
+        # session for the address they came from
+        self._receive_conn = _BaseConnection(self._sock, self._log, journal=self._journal)
+        # Insertion order is the order senders were first heard from
+        self._sessions = {}
+        self._active = None
+        self._change_counter = 0
+
+    def _on_lookout_timeout(self):
+        self._log.debug("Lookout timeout expired, resetting it")
+        self._lookout_timer.reset()
+        if not self._sessions:
+            self._log.debug("Not sending lookout message as no client address")
+        for session in self._sessions.values():
+            self._log.info("Sending lookout message to", session.addr)
+            session.conn.sendto(self._reply_score(session), session.addr)
+
+    def handle_timers(self):
+        if self._lookout_timer.just_expired():
+            self._on_lookout_timeout()
+        expired = False
+        for session in self._sessions.values():
+            if session.timer.just_expired():
+                _SESSIONS_EXPIRED.inc()
+                self._log.info("Sender", session.addr, "has gone quiet, session expired")
+                session.alive = False
+                expired = True
+        if expired:
+            self._arbitrate()
+
+    def next_timeout_millis(self):
+        remaining = [self._lookout_timer.remaining_millis()]
+        remaining += [session.timer.remaining_millis() for session in self._sessions.values()]
+        remaining = [r for r in remaining if r is not None]
+        return min(remaining) if remaining else None
+
+    def on_readable(self):
+        for packet, addr in self._receive_conn.recv_batch(max_packets=self._MAX_PACKETS_PER_READ):
+            self._handle_packet(packet, addr)
+
+    def handle_datagram(self, data, addr):
+        packet, addr = self._receive_conn._decode(data, addr)
+        if packet is not None:
+            self._handle_packet(packet, addr)
+
+    def _reply_score(self, session):
+        """The active sender is sent what's displayed, others their own score"""
+        if session is self._active or session.score is None:
+            return self._score
+        return session.score
+
+    def _get_session(self, addr):
+        session = self._sessions.get(addr)
+        if session is not None:
+            return session
+
+        if len(self._sessions) >= self._MAX_SESSIONS:
+            # Evict a dead session if there is one, else the oldest inactive one
+            candidates = [s for s in self._sessions.values() if s is not self._active]
+            evict = next((s for s in candidates if not s.alive), candidates[0])
+            self._log.info("Sender session table full, evicting", evict.addr)
+            del self._sessions[evict.addr]
+
+        self._log.info("New sender session for", addr)
+        session = _SenderSession(_BaseConnection(self._sock, self._log, journal=self._journal),
+                                 addr,
+                                 self._session_timeout_seconds,
+                                 self._time_now)
+        self._sessions[addr] = session
+        return session
+
+    def _priority(self, session):
+        ip = session.addr[0]
+        return self._priorities.index(ip) if ip in self._priorities else len(self._priorities)
+
+    def _arbitrate(self):
+        """Pick the active session and display its score if that's changed.
+        Returns the session the new score was echoed to, if any."""
+        alive = [s for s in self._sessions.values() if s.alive]
+        if not alive:
+            return None
+
+        def freshness(session):
+            return (session.last_change, session is self._active)
+
+        if self._arbitration == "priority":
+            active = min(alive, key=lambda s: (self._priority(s), tuple(-x for x in freshness(s))))
+        else:
+            active = max(alive, key=freshness)
+
+        if active is not self._active:
+            _ACTIVE_SENDER_CHANGES.inc()
+            self._log.info("Active sender changing from",
+                           self._active.addr if self._active is not None else None, "to",
+                           active.addr)
+            self._active = active
+
+        if active.score is not None and active.score != self._score:
+            self._score = active.score
+            self._log.info("Updating score to", Packet.payload_as_string(self._score),
+                           "and echoing/sending back")
+            write_start = monotonic_millis()
+            self._score_writer(self._score)
+            _SCORE_WRITE_MS.observe(monotonic_millis() - write_start)
+            active.conn.sendto(self._score, active.addr)
+            return active
+        return None
+
+    def _handle_packet(self, packet, addr):
+        log = self._log
+
+        log.info("Received packet:", packet, "from", addr)
+        if addr not in self._sessions:
+            log.info("Packet is from new address:", addr, "- known addresses are:",
+                     list(self._sessions))
+
+        session = self._get_session(addr)
+        conn = session.conn
+        session.timer.reset()
+        if not session.alive:
+            log.info("Sender", addr, "is back")
+            session.alive = True
+            self._arbitrate()
+
+        if packet.sender == conn.rx_id \
                 and packet.receiver == conn.my_id \
-                and packet.id_change == Packet.UNKNOWN_ID \
-                and client_addr == addr:
+                and packet.id_change == Packet.UNKNOWN_ID:
             if packet.sequence_number >= conn.next_remote_seq:
                 conn.next_remote_seq = packet.sequence_number + 1
                 log.info("Got good packet")
-                if packet.payload != score:
-                    score = packet.payload
-                    # if probability(0.2, True, False):
-                    #     print("Setting wrong score for testing")
-                    #     # For testing, set wrong score
-                    #     score = int_to_bytes(-1, 9)
-                    log.info("Updating score to", Packet.payload_as_string(score),
-                             "and echoing/sending back")
-                    args.score_writer(score)
-                    conn.sendto(score, addr)
-                    client_addr = addr
-                    #  lookout_timeout.reset()
+                if packet.payload != session.score:
+                    if session.score is not None:
+                        self._change_counter += 1
+                        session.last_change = self._change_counter
+                    session.score = packet.payload
+                    # Every new score is acknowledged so the sender stops
+                    # retransmitting it, the active sender by _arbitrate if the
+                    # display changed
+                    if self._arbitrate() is not session:
+                        if session is not self._active:
+                            log.info("Sender", addr, "is not the active sender, acknowledging "
+                                     "its score without displaying it")
+                        conn.sendto(self._reply_score(session), addr)
                 else:
                     log.debug("Taking no action as packet contains same score")
             else:
+                _OLD_DUPLICATE_PACKETS.inc()
                 log.info("Got old/duplicate packet")
 
         elif packet.receiver == conn.my_id \
                 and packet.id_change != Packet.UNKNOWN_ID:
+            _ID_CHANGE_HANDSHAKES.inc()
             log.info("Changing id", conn.my_id, "->", packet.id_change,
-                     "and sending id change, changing client addr to", addr)
+                     "and sending id change for sender", addr)
             conn.change_and_send_connection_change(packet, addr)
-            client_addr = addr
+            # A (re)connected sender starts afresh
+            session.score = None
+            session.last_change = 0
 
         else:
             log.info("Got unknown sending back my details")
-            conn.sendto(score, addr)
+            conn.sendto(self._reply_score(session), addr)
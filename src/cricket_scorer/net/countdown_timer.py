@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import heapq
+import itertools
 import sys
 import time
 
@@ -8,7 +10,31 @@ import time
 # See https://docs.micropython.org/en/latest/library/utime.html
 
 
-def make_countdown_timer(*, millis=None, seconds=None, started=True):
+def monotonic_millis():
+    return time.monotonic() * 1000
+
+
+class VirtualClock:
+    """Stand in for monotonic_millis that only moves when told to, so a
+    simulation (see net.simulation) can jump straight to the next deadline
+    rather than waiting for it. Anything taking a time_now takes one."""
+    def __init__(self, start_millis=0):
+        self._now = start_millis
+
+    def __call__(self):
+        return self._now
+
+    def advance(self, millis):
+        assert millis >= 0, "Time only goes forwards"
+        self._now += millis
+
+    def advance_to(self, millis):
+        assert millis >= self._now, "Time only goes forwards"
+        self._now = millis
+
+
+def make_countdown_timer(*, millis=None, seconds=None, started=True, time_now=monotonic_millis):
+    """time_now is a clock in millis, eg. a VirtualClock"""
     assert (millis is not None) ^ (seconds is not None)
     if seconds is not None:
         millis = seconds * 1000
@@ -17,7 +43,8 @@ def make_countdown_timer(*, millis=None, seconds=None, started=True):
     #     time_now = lambda: time.ticks_ms()
     #     diff = time.ticks_diff
     # else:
-    time_now = lambda: int(time.monotonic() * 1000)
+    clock = time_now
+    time_now = lambda: int(clock())
     # Cannot import here as imported processed on file parse?
     # from operator import sub
     # diff = sub
@@ -67,6 +94,13 @@ class CountdownTimer:
         self._expired = self._remaining_time() <= 0
         return self._expired
 
+    def remaining_millis(self):
+        """Time until this will just_expire, 0 if due now, None if it already
+        has (or is stopped)"""
+        if self._expired:
+            return None
+        return max(self._remaining_time(), 0)
+
     def sleep_till_expired(self):
         if self._expired:
             return
@@ -79,13 +113,132 @@ class CountdownTimer:
     def stop(self):
         self._expired = True
 
-    def reset(self):
+    def reset(self, millis=None):
+        """Restart the countdown, optionally changing its length"""
+        if millis is not None:
+            self._countdown_millis = int(millis)
         self._last = self._time_now()
         self._expired = False
         return self
 
 
+class ScheduledCall:
+    """Handle for a callback added to a Scheduler, which may be cancelled"""
+
+    __slots__ = ("deadline", "interval", "callback", "cancelled")
+
+    def __init__(self, deadline, interval, callback):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Deadlines kept in a heap, so the next wake up is known without checking
+    every timer, and callbacks are called when they're due.
+
+    Pass next_timeout_millis to select/epoll/window.read as the timeout, then
+    call run_due afterwards.
+
+    s = Scheduler()
+    s.call_every(2000, spin)
+    call = s.call_later(15000, clear_error)
+    call.cancel()
+    while True:
+        wait_for_events(timeout_ms=s.next_timeout_millis())
+        s.run_due()
+    """
+    def __init__(self, time_now=monotonic_millis):
+        self._time_now = time_now
+        # Entries are (deadline, insertion count, call) so equal deadlines are
+        # called in the order they were added and calls are never compared
+        self._heap = []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        self._discard_cancelled()
+        return len(self._heap)
+
+    def _push(self, call):
+        heapq.heappush(self._heap, (call.deadline, next(self._counter), call))
+        return call
+
+    def call_later(self, millis, callback):
+        return self._push(ScheduledCall(self._time_now() + millis, None, callback))
+
+    def call_every(self, millis, callback):
+        """Called every millis, first in millis time. Missed calls aren't made
+        up for if the loop runs late."""
+        assert millis > 0
+        return self._push(ScheduledCall(self._time_now() + millis, millis, callback))
+
+    def _discard_cancelled(self):
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+
+    def next_timeout_millis(self):
+        """Time until the next call is due, 0 if one is overdue and None if
+        nothing is scheduled"""
+        self._discard_cancelled()
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - self._time_now(), 0)
+
+    def run_due(self):
+        """Calls everything that's due, returns how many were called"""
+        now = self._time_now()
+        called = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, _, call = heapq.heappop(self._heap)
+            if call.cancelled:
+                continue
+            if call.interval is not None:
+                # Next due strictly after now, so a late call is only made
+                # once here and the ones it missed are skipped
+                call.deadline += call.interval * (1 + (now - call.deadline) // call.interval)
+                self._push(call)
+            else:
+                call.cancelled = True
+            call.callback()
+            called += 1
+        return called
+
+
 def main(argv):
+    now = 0
+    s = Scheduler(time_now=lambda: now)
+    fired = []
+    s.call_later(30, lambda: fired.append("a"))
+    s.call_every(20, lambda: fired.append("b"))
+    s.call_later(5, lambda: fired.append("c")).cancel()
+    assert s.next_timeout_millis() == 20
+    now = 25
+    assert s.run_due() == 1 and fired == ["b"]
+    assert s.next_timeout_millis() == 5
+    now = 40
+    assert s.run_due() == 2 and fired == ["b", "a", "b"]
+    assert len(s) == 1
+
+    # Running late makes one call, not one for each that was missed
+    now = 1000
+    assert s.run_due() == 1 and fired == ["b", "a", "b", "b"]
+    assert s.next_timeout_millis() == 20
+    now = 1019
+    assert s.run_due() == 0
+    now = 1020
+    assert s.run_due() == 1
+
+    clock = VirtualClock()
+    t = make_countdown_timer(millis=100, time_now=clock)
+    clock.advance(99)
+    assert not t.just_expired() and t.remaining_millis() == 1
+    clock.advance_to(100)
+    assert t.just_expired()
+
     t = make_countdown_timer(seconds=5)
     # Yes side effects in asserts are bad but this is a quick test
     assert not t.just_expired()
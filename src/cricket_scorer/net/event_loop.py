@@ -0,0 +1,90 @@
+import selectors
+
+from .countdown_timer import Scheduler, monotonic_millis
+
+
+class EventLoop:
+    """Single threaded readiness loop built on selectors.DefaultSelector (so
+    epoll on Linux, select on Windows)
+
+    File objects (sockets, including SimpleUDP, or anything else with a
+    fileno() such as a reader's notification fd) are registered once with a
+    callback that is called with no arguments whenever they're readable.
+    Callbacks may be scheduled on the loop's Scheduler with call_later and
+    call_every, and a state machine's own timers (eg. a Sender's) kept
+    serviced with add_timers. The loop sleeps until exactly the next of these
+    is due.
+
+    loop = EventLoop(log)
+    loop.register(sock, receiver.on_readable)
+    loop.add_timers(receiver.next_timeout_millis, receiver.handle_timers)
+    loop.call_every(100, read_score)
+    while True:
+        loop.run_once()
+    """
+    def __init__(self, log, time_now=monotonic_millis):
+        self._log = log
+        self._selector = selectors.DefaultSelector()
+        self._time_now = time_now
+        self.scheduler = Scheduler(time_now)
+        # (next_timeout_millis, handle_timers, ScheduledCall or None)
+        self._timer_sources = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._selector.close()
+
+    def register(self, fileobj, callback):
+        self._log.debug(f"Event loop registering {fileobj}")
+        self._selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def unregister(self, fileobj):
+        self._selector.unregister(fileobj)
+
+    def call_later(self, millis, callback):
+        return self.scheduler.call_later(millis, callback)
+
+    def call_every(self, millis, callback):
+        return self.scheduler.call_every(millis, callback)
+
+    def add_timers(self, next_timeout_millis, handle_timers):
+        """Keep handle_timers scheduled for whenever next_timeout_millis says
+        it's next due. That's asked again after every loop iteration, as
+        anything that's happened may have changed it."""
+        self._timer_sources.append([next_timeout_millis, handle_timers, None])
+        self._reschedule_timers()
+
+    def _reschedule_timers(self):
+        # Usually nothing's changed, so only replace a call whose deadline has
+        # (cancelled calls stay in the scheduler's heap until they're due)
+        now = self._time_now()
+        for source in self._timer_sources:
+            next_timeout_millis, handle_timers, call = source
+            millis = next_timeout_millis()
+            deadline = None if millis is None else now + millis
+            if call is not None and not call.cancelled and call.deadline == deadline:
+                continue
+            if call is not None:
+                call.cancel()
+            source[2] = None if millis is None else self.scheduler.call_later(
+                millis, handle_timers)
+
+    def run_once(self, timeout_ms=None):
+        """Wait until the next scheduled call is due, or up to timeout_ms if
+        that's sooner (forever if both are None), for events, then dispatch
+        them and anything that's due. Returns the number of ready file
+        objects."""
+        timeouts = [t for t in (timeout_ms, self.scheduler.next_timeout_millis()) if t is not None]
+        timeout_ms = min(timeouts) if timeouts else None
+        events = self._selector.select(None if timeout_ms is None else timeout_ms / 1000)
+        for key, _ in events:
+            key.data()
+        self.scheduler.run_due()
+        if self._timer_sources:
+            self._reschedule_timers()
+        return len(events)
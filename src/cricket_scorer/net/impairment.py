@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Simulated bad networks, in process, for testing the protocol
+
+An ImpairedChannel decides, from a seeded random generator, what happens to
+each datagram sent through it: dropped (uniformly or in Gilbert-Elliott
+bursts), delayed, duplicated, held back so later datagrams overtake it, or
+corrupted. The same seed and sequence of datagrams always gives the same
+outcome.
+
+ImpairedUDP is a SimpleUDP whose sends go through a channel, the delayed ones
+sent on by a background thread when due, so the other end receives them on a
+real socket as it would over a bad network. It replaces the tc/netem setup in
+scratch/network_slowdown.sh, and needs neither sudo nor Linux. Select it in a
+profile with add_impaired_sock.
+"""
+
+import dataclasses
+import heapq
+import random
+import sys
+import threading
+import time
+
+from cricket_scorer.net.udp_receive import SimpleUDP
+
+
+@dataclasses.dataclass(frozen=True)
+class Impairment:
+    """What a channel does to datagrams. Probabilities are 0 to 1."""
+    # Delay of each datagram, delay_millis +/- jitter_millis, either
+    # "uniform" or "normal" (jitter is the standard deviation), never negative
+    delay_millis: float = 0
+    jitter_millis: float = 0
+    delay_distribution: str = "uniform"
+    # Gilbert-Elliott loss. The channel moves between a good and a bad state
+    # (with these probabilities per datagram) losing datagrams with
+    # loss_good/loss_bad in each. With the default transitions it's only ever
+    # in the good state, so loss_good is plain random loss.
+    loss_good: float = 0
+    loss_bad: float = 1
+    good_to_bad: float = 0
+    bad_to_good: float = 1
+    # A copy is sent too (delayed independently)
+    duplicate: float = 0
+    # Held back an extra reorder_millis so later datagrams overtake it
+    reorder: float = 0
+    reorder_millis: float = 0
+    # One random bit flipped
+    corrupt: float = 0
+
+    def __post_init__(self):
+        assert self.delay_distribution in ("uniform", "normal"), self.delay_distribution
+        for name in ("loss_good", "loss_bad", "good_to_bad", "bad_to_good", "duplicate",
+                     "reorder", "corrupt"):
+            assert 0 <= getattr(self, name) <= 1, f"{name} must be a probability"
+
+
+# Named impairments for profiles and benchmarks
+PRESETS = {
+    "perfect": Impairment(),
+    "lan": Impairment(delay_millis=2, jitter_millis=1),
+    "lossy": Impairment(delay_millis=20, jitter_millis=10, loss_good=0.1),
+    # Mostly fine, with bursts (averaging 5 datagrams) of nearly everything lost
+    "bad_wifi": Impairment(delay_millis=30,
+                           jitter_millis=20,
+                           delay_distribution="normal",
+                           loss_good=0.02,
+                           loss_bad=0.9,
+                           good_to_bad=0.05,
+                           bad_to_good=0.2,
+                           duplicate=0.02,
+                           reorder=0.05,
+                           reorder_millis=100,
+                           corrupt=0.005),
+    # Roughly what scratch/network_slowdown.sh did
+    "netem_script": Impairment(delay_millis=100,
+                               loss_good=0.3,
+                               duplicate=0.2,
+                               reorder=0.5,
+                               reorder_millis=100,
+                               corrupt=0.01),
+}
+
+
+def get_impairment(impairment):
+    """An Impairment, or the name of one in PRESETS"""
+    if isinstance(impairment, Impairment):
+        return impairment
+    if impairment not in PRESETS:
+        raise ValueError(f"No impairment named {impairment}, choose from: {list(PRESETS)}")
+    return PRESETS[impairment]
+
+
+class ImpairedChannel:
+    """Decides the fate of each datagram sent through it, see the top of this
+    file. Keeps counts of what it did in stats."""
+    def __init__(self, impairment, seed=0):
+        self.impairment = get_impairment(impairment)
+        self._random = random.Random(seed)
+        self._bad_state = False
+        self.stats = dict.fromkeys(
+            ("sent", "lost", "duplicated", "reordered", "corrupted", "delivered"), 0)
+
+    def _delay(self):
+        imp = self.impairment
+        if imp.delay_distribution == "normal":
+            delay = self._random.gauss(imp.delay_millis, imp.jitter_millis)
+        else:
+            delay = self._random.uniform(imp.delay_millis - imp.jitter_millis,
+                                         imp.delay_millis + imp.jitter_millis)
+        if imp.reorder and self._random.random() < imp.reorder:
+            self.stats["reordered"] += 1
+            delay += imp.reorder_millis
+        return max(delay, 0)
+
+    def _corrupt(self, data):
+        if not (self.impairment.corrupt and self._random.random() < self.impairment.corrupt):
+            return data
+        self.stats["corrupted"] += 1
+        bit = self._random.randrange(len(data) * 8)
+        data = bytearray(data)
+        data[bit // 8] ^= 1 << (bit % 8)
+        return bytes(data)
+
+    def _lost(self):
+        imp = self.impairment
+        if self._bad_state:
+            self._bad_state = self._random.random() >= imp.bad_to_good
+        else:
+            self._bad_state = self._random.random() < imp.good_to_bad
+        loss = imp.loss_bad if self._bad_state else imp.loss_good
+        return bool(loss) and self._random.random() < loss
+
+    def transmit(self, data):
+        """List of (delay_millis, data) to deliver for one datagram sent,
+        empty if it's lost"""
+        data = bytes(data)
+        self.stats["sent"] += 1
+        if self._lost():
+            self.stats["lost"] += 1
+            return []
+        copies = 1
+        if self.impairment.duplicate and self._random.random() < self.impairment.duplicate:
+            self.stats["duplicated"] += 1
+            copies = 2
+        deliveries = [(self._delay(), self._corrupt(data)) for _ in range(copies)]
+        self.stats["delivered"] += len(deliveries)
+        return deliveries
+
+
+class ImpairedUDP(SimpleUDP):
+    """A SimpleUDP whose sends go through an ImpairedChannel, see the top of
+    this file. A send "succeeds" even if the channel loses it, as the real
+    thing would."""
+    def __init__(self, log, server_port, host_ip_bind="0.0.0.0", *, impairment, seed=0):
+        super().__init__(log, server_port, host_ip_bind)
+        self._channel = ImpairedChannel(impairment, seed)
+        # Heap of (due perf_counter seconds, tiebreak, data, addr)
+        self._pending = []
+        self._pending_count = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="impaired udp", daemon=True)
+        self._thread.start()
+        self._log.info("Impaired socket on port", server_port, "with", self._channel.impairment,
+                       "seed", seed)
+
+    @property
+    def channel(self):
+        return self._channel
+
+    @property
+    def stats(self):
+        return self._channel.stats
+
+    def sendto(self, data, addr):
+        assert isinstance(data, (bytes, bytearray, memoryview))
+        now = time.perf_counter()
+        for delay_millis, datagram in self._channel.transmit(data):
+            if delay_millis == 0:
+                super().sendto(datagram, addr)
+                continue
+            with self._condition:
+                self._pending_count += 1
+                heapq.heappush(self._pending,
+                               (now + delay_millis / 1000, self._pending_count, datagram, addr))
+                self._condition.notify()
+        return True
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                wait = self._pending[0][0] - time.perf_counter()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                _, _, datagram, addr = heapq.heappop(self._pending)
+                super().sendto(datagram, addr)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._log.info("Impaired socket closing, stats:", self._channel.stats)
+        super().close()
+
+
+def main(argv):
+    from cricket_scorer.misc import my_logger
+
+    # Deterministic
+    a, b = ImpairedChannel("bad_wifi", seed=3), ImpairedChannel("bad_wifi", seed=3)
+    packets = [bytes([i % 256]) * 25 for i in range(5000)]
+    assert [a.transmit(p) for p in packets] == [b.transmit(p) for p in packets]
+    print(a.stats)
+    assert a.stats["lost"] and a.stats["duplicated"] and a.stats["corrupted"]
+
+    # Bursty: losses are more likely straight after a loss than on average
+    c = ImpairedChannel(Impairment(loss_bad=1, good_to_bad=0.02, bad_to_good=0.25), seed=1)
+    lost = [not c.transmit(b"x") for _ in range(20000)]
+    after_loss = [lost[i + 1] for i in range(len(lost) - 1) if lost[i]]
+    assert sum(after_loss) / len(after_loss) > 2 * sum(lost) / len(lost)
+
+    assert ImpairedChannel("perfect").transmit(b"abc") == [(0, b"abc")]
+
+    log = my_logger.get_logger()
+    with SimpleUDP(log, 0, "127.0.0.1") as receiver:
+        addr = receiver.socket().getsockname()
+        sender = ImpairedUDP(log, 0, "127.0.0.1", impairment=Impairment(delay_millis=50))
+        start = time.perf_counter()
+        sender.sendto(b"hello", addr)
+        assert receiver.recvfrom(5, timeout_ms=1000) == (b"hello", sender.socket().getsockname())
+        assert time.perf_counter() - start >= 0.05
+        sender.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
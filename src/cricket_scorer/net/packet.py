@@ -1,11 +1,26 @@
+import struct
 import sys
 
-from .utility import int_to_bytes
 from .sequence_numbers import SequenceNumber
 
+# struct format characters for the unsigned integer fields, keyed by byte size
+_STRUCT_UINT_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+
+def _make_codec(id_size, sequence_number_size, payload_size):
+    """Build the (little endian) wire format once from the field sizes
+
+    Layout is sender, receiver, id_change, sequence number, payload
+    """
+    id_format = _STRUCT_UINT_FORMATS[id_size]
+    sequence_number_format = _STRUCT_UINT_FORMATS[sequence_number_size]
+    return struct.Struct("<" + id_format * 3 + sequence_number_format + f"{payload_size}s")
+
 
 class Packet:
 
+    __slots__ = ("sender", "receiver", "id_change", "sequence_number", "payload")
+
     UNKNOWN_ID = 0
 
     ID_SIZE = 4
@@ -13,16 +28,12 @@ class Packet:
     # This tight coupling sucks - maybe some kind of factory to fix, lot of work
     PAYLOAD_SIZE = 9
 
-    # https://stackoverflow.com/a/32720603
-    # Micropython class objects do not seem to have this mappingproxy object
-    # called "__dict__" for accessing class attributes.
-    # Would've used.
-    # return sum(v for k, v in cls.__dict__.items() if k.isupper() and k.endswith("_SIZE"))
+    # Precompiled wire format, see _make_codec
+    CODEC = _make_codec(ID_SIZE, SEQUENCE_NUMBER_SIZE, PAYLOAD_SIZE)
+
     @classmethod
     def packet_size(cls):
-        return cls.ID_SIZE * 3 + cls.SEQUENCE_NUMBER_SIZE + cls.PAYLOAD_SIZE
-        # return sum(getattr(cls, x) for x in dir(cls) if x.isupper()
-        #         and x.endswith("_SIZE") and type(getattr(cls, x)) is int)
+        return cls.CODEC.size
 
     @classmethod
     def payload_as_string(cls, payload):
@@ -59,53 +70,66 @@ class Packet:
         self.sequence_number = sequence_number
         self.payload = payload
 
+    @classmethod
+    def _trusted(cls, sender, receiver, id_change, sequence_number, payload):
+        """Construct without validating the fields. Only for values that can't
+        be out of range, ie. those just unpacked by CODEC
+        """
+        packet = cls.__new__(cls)
+        packet.sender = sender
+        packet.receiver = receiver
+        packet.id_change = id_change
+        packet.sequence_number = SequenceNumber(sequence_number,
+                                                bytes_=cls.SEQUENCE_NUMBER_SIZE)
+        packet.payload = payload
+        return packet
+
     def __bytes__(self):
-        cls = type(self)
-        ba = bytearray()
-        ba += int_to_bytes(self.sender, cls.ID_SIZE)
-        ba += int_to_bytes(self.receiver, cls.ID_SIZE)
-        ba += int_to_bytes(self.id_change, cls.ID_SIZE)
-        ba += int_to_bytes(self.sequence_number.__int__(), cls.SEQUENCE_NUMBER_SIZE)
-        ba += self.payload
-        return bytes(ba)
+        return self.CODEC.pack(self.sender, self.receiver, self.id_change,
+                               self.sequence_number.__int__(), self.payload)
+
+    def pack_into(self, buffer, offset=0):
+        """Serialise into a writable buffer (eg. a reused bytearray) without
+        allocating. Returns the number of bytes written.
+        """
+        self.CODEC.pack_into(buffer, offset, self.sender, self.receiver, self.id_change,
+                             self.sequence_number.__int__(), self.payload)
+        return self.CODEC.size
 
     @classmethod
     def from_bytes(cls, bytes_):
-        # print("Received in from_bytes:", bytes_)
+        """Decode from any bytes-like object, including a memoryview over a
+        receive buffer. The payload is copied out so the buffer may be reused.
+        """
         if bytes_ is None:
             return None
-        assert len(bytes_) == Packet.packet_size()
-        # Holy lack of DRY batman. This is so error prone, I hate it.
-        offsets = offset_slices(bytes_, cls.ID_SIZE, cls.ID_SIZE, cls.ID_SIZE,
-                                cls.SEQUENCE_NUMBER_SIZE, cls.PAYLOAD_SIZE)
-        val = lambda: next(offsets)
-        packet = Packet(sender=int.from_bytes(val(), sys.byteorder),
-                        receiver=int.from_bytes(val(), sys.byteorder),
-                        id_change=int.from_bytes(val(), sys.byteorder),
-                        sequence_number=SequenceNumber(int.from_bytes(val(), sys.byteorder),
-                                                       bytes_=cls.SEQUENCE_NUMBER_SIZE),
-                        payload=val())
-        try:
-            val()
-        except StopIteration:
-            pass
-        else:
-            assert False, "Should've raised StopIteration, byte offsets don't "\
-                "consume all of input"
-        return packet
+        assert len(bytes_) == cls.CODEC.size
+        return cls._trusted(*cls.CODEC.unpack_from(bytes_))
 
     def __eq__(self, other):
-        if type(other) is not type(other):
+        if type(self) is not type(other):
             return NotImplemented
-        return self.__dict__ == other.__dict__
-
-
-def offset_slices(bytes_, *offsets):
-    assert sum(offsets) == len(bytes_)
-    acc = 0
-    for offset in offsets:
-        yield bytes_[acc:acc + offset]
-        acc += offset
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
+
+
+def main(argv):
+    p = Packet(sender=1,
+               receiver=2**32 - 1,
+               id_change=3,
+               sequence_number=SequenceNumber(n=12345, bytes_=Packet.SEQUENCE_NUMBER_SIZE),
+               payload=bytes(range(Packet.PAYLOAD_SIZE)))
+    b = bytes(p)
+    assert len(b) == Packet.packet_size() == 3 * Packet.ID_SIZE \
+        + Packet.SEQUENCE_NUMBER_SIZE + Packet.PAYLOAD_SIZE
+    assert b[:4] == b"\x01\x00\x00\x00"
+    assert Packet.from_bytes(b) == p
+    assert Packet.from_bytes(memoryview(b)) == p
+
+    buf = bytearray(Packet.packet_size() + 3)
+    assert p.pack_into(buf, 3) == Packet.packet_size()
+    assert Packet.from_bytes(memoryview(buf)[3:]) == p
+    assert type(Packet.from_bytes(memoryview(buf)[3:]).payload) is bytes
+    print(p)
 
 
 if __name__ == "__main__":
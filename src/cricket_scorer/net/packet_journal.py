@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Binary journal of every packet sent and received, and a decoder for it
+
+A journal file is a header followed by fixed size records, all little endian:
+
+header: magic b"CSPJ", format version (B), packet size (B), wall clock time
+        (Q, ns since the epoch) and monotonic time (Q, ns) when it was created
+record: monotonic time (Q, ns), direction (B, 0 received 1 sent), IPv4
+        address (4s), port (H), then the packet exactly as on the wire
+
+Records are packed into a buffer and written when it fills, or when
+flush_interval_seconds has passed since it was last written, so journaling
+costs next to nothing per packet. So an idle box's last packets aren't lost
+on a power cut, sync should also be called every flush_interval_seconds (see
+connection.schedule_journal_sync), which writes the buffer and fsyncs. A
+partial record at the end (eg. after a power cut) is ignored by the decoder.
+
+Decode with
+    python -m cricket_scorer.net.packet_journal [--csv] journal_file
+"""
+
+import argparse
+import collections
+import csv
+import datetime
+import os
+import pathlib
+import socket
+import struct
+import sys
+import time
+
+from .packet import Packet
+
+MAGIC = b"CSPJ"
+VERSION = 1
+
+RECEIVED = 0
+SENT = 1
+_DIRECTION_NAMES = {RECEIVED: "recv", SENT: "send"}
+
+_HEADER = struct.Struct("<4sBBQQ")
+_RECORD = struct.Struct(f"<QB4sH{Packet.packet_size()}s")
+
+JournalRecord = collections.namedtuple("JournalRecord",
+                                       ["monotonic_ns", "wall_time", "direction", "addr", "packet"])
+
+
+def _pack_ip(ip):
+    try:
+        return socket.inet_aton(ip)
+    except OSError:
+        # Not IPv4
+        return bytes(4)
+
+
+class PacketJournal:
+    """Appends packets to a journal file, see the top of this file"""
+    def __init__(self, path, *, buffer_records=1024, flush_interval_seconds=5.0):
+        self.path = path
+        self.flush_interval_seconds = flush_interval_seconds
+        self._flush_interval_ns = int(flush_interval_seconds * 1e9)
+        self._file = open(path, "wb")
+        self._file.write(
+            _HEADER.pack(MAGIC, VERSION, Packet.packet_size(), time.time_ns(),
+                         time.monotonic_ns()))
+        self._buffer = bytearray(_RECORD.size * buffer_records)
+        self._used = 0
+        self._last_flush_ns = time.monotonic_ns()
+        self._unsynced = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record(self, direction, addr, data):
+        """data is the packet's bytes (any bytes-like object)"""
+        now = time.monotonic_ns()
+        _RECORD.pack_into(self._buffer, self._used, now, direction, _pack_ip(addr[0]), addr[1],
+                          bytes(data))
+        self._used += _RECORD.size
+        if self._used == len(self._buffer) or now - self._last_flush_ns >= self._flush_interval_ns:
+            self.flush()
+
+    def flush(self):
+        if self._used:
+            self._file.write(memoryview(self._buffer)[:self._used])
+            self._used = 0
+            self._unsynced = True
+        self._file.flush()
+        self._last_flush_ns = time.monotonic_ns()
+
+    def sync(self):
+        """Flush, and fsync if anything's been written since the last sync"""
+        if self._file.closed:
+            return
+        self.flush()
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def open_datetime_journal(journal_folder, **journal_kwargs):
+    """New journal in journal_folder named by the current time"""
+    pathlib.Path(journal_folder).mkdir(parents=True, exist_ok=True)
+    name = datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".pjournal"
+    return PacketJournal(os.path.join(journal_folder, name), **journal_kwargs)
+
+
+def read_journal(path):
+    """Generator of JournalRecords"""
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError(f"{path} is too short to be a packet journal")
+        magic, version, packet_size, wall_ns, monotonic_ns = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} packet journal")
+        if packet_size != Packet.packet_size():
+            raise ValueError(f"{path} has packets of {packet_size} bytes, "
+                             f"expected {Packet.packet_size()}")
+
+        while True:
+            chunk = f.read(_RECORD.size * 1024)
+            for timestamp, direction, ip, port, data in _RECORD.iter_unpack(
+                    chunk[:len(chunk) - len(chunk) % _RECORD.size]):
+                wall_time = datetime.datetime.fromtimestamp(
+                    (wall_ns + timestamp - monotonic_ns) / 1e9)
+                yield JournalRecord(timestamp, wall_time, direction,
+                                    (socket.inet_ntoa(ip), port), Packet.from_bytes(data))
+            if len(chunk) < _RECORD.size * 1024:
+                return
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m cricket_scorer.net.packet_journal",
+                                     description="Print a packet journal")
+    parser.add_argument("journal_file")
+    parser.add_argument("--csv", action="store_true", help="Write CSV rather than a table")
+    parsed_args = parser.parse_args(argv[1:])
+
+    if parsed_args.csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow([
+            "wall_time", "monotonic_ns", "direction", "ip", "port", "sender", "receiver",
+            "id_change", "sequence_number", "payload"
+        ])
+        for r in read_journal(parsed_args.journal_file):
+            p = r.packet
+            writer.writerow([
+                r.wall_time.isoformat(), r.monotonic_ns, _DIRECTION_NAMES[r.direction],
+                r.addr[0], r.addr[1], p.sender, p.receiver, p.id_change, p.sequence_number,
+                Packet.payload_as_string(p.payload)
+            ])
+    else:
+        for r in read_journal(parsed_args.journal_file):
+            print(r.wall_time.strftime("%Y-%m-%d %H:%M:%S.%f"), _DIRECTION_NAMES[r.direction],
+                  "{}:{}".format(*r.addr), r.packet)
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except BrokenPipeError:
+        # Piped into head etc.
+        sys.exit(1)
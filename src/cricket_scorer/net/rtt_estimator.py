@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import sys
+
+# Round trip time estimation and retransmission timeout (RTO) calculation as
+# TCP does it, see RFC 6298 https://datatracker.ietf.org/doc/html/rfc6298
+# All times are in milliseconds.
+
+
+class RttEstimator:
+    """Smoothed round trip time (srtt), its variation (rttvar) and the derived
+    retransmission timeout, with exponential backoff.
+
+    Only feed add_sample with round trips of packets that were sent exactly
+    once (Karn's algorithm), as a reply to a retransmitted packet is ambiguous.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+    # Clock granularity
+    G = 1
+
+    def __init__(self, *, initial_rto_millis, min_rto_millis, max_rto_millis):
+        assert 0 < min_rto_millis <= max_rto_millis
+        self._min_rto_millis = min_rto_millis
+        self._max_rto_millis = max_rto_millis
+
+        self.srtt = None
+        self.rttvar = None
+        self._rto_millis = self._clamp(initial_rto_millis)
+        self._backoff = 1
+
+    def __str__(self):
+        srtt = "-" if self.srtt is None else f"{self.srtt:.1f}"
+        rttvar = "-" if self.rttvar is None else f"{self.rttvar:.1f}"
+        return f"{{srtt: {srtt}, rttvar: {rttvar}, rto: {self.rto_millis():.1f}}}"
+
+    def _clamp(self, millis):
+        return min(max(millis, self._min_rto_millis), self._max_rto_millis)
+
+    def add_sample(self, rtt_millis):
+        assert rtt_millis >= 0
+        if self.srtt is None:
+            self.srtt = rtt_millis
+            self.rttvar = rtt_millis / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt_millis)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt_millis
+        self._rto_millis = self._clamp(self.srtt + max(self.G, self.K * self.rttvar))
+        self._backoff = 1
+
+    def rto_millis(self):
+        return self._clamp(self._rto_millis * self._backoff)
+
+    def back_off(self):
+        """Double the timeout (until it reaches the maximum) after a timeout"""
+        if self._rto_millis * self._backoff < self._max_rto_millis:
+            self._backoff *= 2
+
+    def reset_backoff(self):
+        self._backoff = 1
+
+
+def main(argv):
+    r = RttEstimator(initial_rto_millis=500, min_rto_millis=100, max_rto_millis=10000)
+    assert r.rto_millis() == 500
+    r.back_off()
+    assert r.rto_millis() == 1000
+    r.add_sample(40)
+    assert r.srtt == 40 and r.rttvar == 20
+    assert r.rto_millis() == 120
+    for _ in range(100):
+        r.add_sample(40)
+    assert r.rto_millis() == 100
+    for _ in range(20):
+        r.back_off()
+    assert r.rto_millis() == 10000
+    r.reset_backoff()
+    assert r.rto_millis() == 100
+    print(r)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
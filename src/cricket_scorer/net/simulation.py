@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""Faster than real time, deterministic runs of the protocol
+
+Senders and receivers run unmodified on a VirtualClock, talking over an
+InMemoryNetwork whose links are ImpairedChannels (see impairment). A
+Simulation is a discrete event loop standing in for EventLoop: rather than
+sleeping until the next timer, datagram delivery or scheduled call, it moves
+the clock straight to it. Hours of a match take well under a second, and the
+same seed always gives the same run.
+
+    python -m cricket_scorer.net.simulation [hours] [impairment]
+"""
+
+import collections
+import heapq
+import itertools
+import logging
+import random
+import sys
+import time
+import types
+
+from .connection import Sender, _Receiver
+from .countdown_timer import Scheduler, VirtualClock
+from .impairment import ImpairedChannel
+from .packet import Packet
+from .utility import int_to_bytes
+
+
+class InMemoryUDP:
+    """A socket on an InMemoryNetwork with the parts of SimpleUDP's interface
+    the connections use. Never blocks: waiting for a datagram moves the
+    network's clock on instead."""
+    def __init__(self, network, addr):
+        self._network = network
+        self.addr = addr
+        self._queue = collections.deque()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def _deliver(self, data, addr):
+        self._queue.append((data, addr))
+
+    def sendto(self, data, addr):
+        assert isinstance(data, (bytes, bytearray, memoryview))
+        self._network._send(self.addr, addr, data)
+        return True
+
+    def drain(self, num_bytes, *, max_datagrams=None):
+        assert num_bytes > 0
+        reads = 0
+        while self._queue and (max_datagrams is None or reads < max_datagrams):
+            reads += 1
+            data, addr = self._queue.popleft()
+            if len(data) == num_bytes:
+                yield memoryview(data), addr
+
+    def recvfrom_view(self, num_bytes, *, timeout_ms=50):
+        """As SimpleUDP's, "blocking" up to timeout_ms of virtual time"""
+        if not self._queue:
+            self._network.run_for(timeout_ms, until=lambda: self._queue)
+        return next(self.drain(num_bytes, max_datagrams=1), (None, None))
+
+    def recvfrom(self, num_bytes, *, timeout_ms=50):
+        data, addr = self.recvfrom_view(num_bytes, timeout_ms=timeout_ms)
+        return (None, None) if data is None else (bytes(data), addr)
+
+
+class InMemoryNetwork:
+    """Datagrams between InMemoryUDP sockets, through an ImpairedChannel per
+    (source, destination) link. Datagrams to an address with no socket are
+    lost."""
+    def __init__(self, clock, impairment="perfect", seed=0):
+        self.clock = clock
+        self._impairment = impairment
+        self._seed = seed
+        self._link_impairments = {}
+        self._channels = {}
+        self._sockets = {}
+        # Heap of (deliver at millis, tiebreak, destination, source, data)
+        self._in_flight = []
+        self._counter = itertools.count()
+
+    def socket(self, addr):
+        assert addr not in self._sockets or self._sockets[addr].closed, f"{addr} in use"
+        sock = self._sockets[addr] = InMemoryUDP(self, addr)
+        return sock
+
+    def set_link_impairment(self, source, destination, impairment):
+        """Override the network's impairment for datagrams from source to
+        destination, before any are sent"""
+        assert (source, destination) not in self._channels
+        self._link_impairments[(source, destination)] = impairment
+
+    def channel(self, source, destination):
+        link = (source, destination)
+        channel = self._channels.get(link)
+        if channel is None:
+            # Seeded by link creation order, so runs are repeatable
+            channel = self._channels[link] = ImpairedChannel(
+                self._link_impairments.get(link, self._impairment),
+                seed=self._seed * 1000 + len(self._channels))
+        return channel
+
+    def _send(self, source, destination, data):
+        for delay_millis, datagram in self.channel(source, destination).transmit(data):
+            heapq.heappush(self._in_flight, (self.clock() + delay_millis, next(
+                self._counter), destination, source, datagram))
+
+    def next_delivery_millis(self):
+        if not self._in_flight:
+            return None
+        return max(self._in_flight[0][0] - self.clock(), 0)
+
+    def deliver_due(self):
+        """Moves datagrams that have arrived to their sockets, returns the
+        sockets that received any in the order they did"""
+        now = self.clock()
+        readable = {}
+        while self._in_flight and self._in_flight[0][0] <= now:
+            _, _, destination, source, datagram = heapq.heappop(self._in_flight)
+            sock = self._sockets.get(destination)
+            if sock is not None and not sock.closed:
+                sock._deliver(datagram, source)
+                readable[sock] = None
+        return list(readable)
+
+    def run_for(self, millis, until=lambda: False):
+        """Delivers datagrams for up to millis of virtual time, stopping early
+        once until() is true"""
+        end = self.clock() + millis
+        self.deliver_due()
+        while not until():
+            wait = self.next_delivery_millis()
+            if wait is None or self.clock() + wait > end:
+                self.clock.advance_to(end)
+                return
+            self.clock.advance(wait)
+            self.deliver_due()
+
+
+class Simulation:
+    """Drives endpoints (Senders, _Receivers, anything with on_readable,
+    next_timeout_millis and handle_timers) on an InMemoryNetwork, jumping the
+    clock from one event to the next. Callbacks may be scheduled on it like
+    an EventLoop."""
+
+    # More steps than this without time moving means something's spinning
+    _MAX_STEPS_PER_INSTANT = 10000
+
+    def __init__(self, network):
+        self.network = network
+        self.clock = network.clock
+        self.scheduler = Scheduler(self.clock)
+        self._endpoints = {}
+
+    def add(self, sock, endpoint):
+        self._endpoints[sock] = endpoint
+
+    def call_later(self, millis, callback):
+        return self.scheduler.call_later(millis, callback)
+
+    def call_every(self, millis, callback):
+        return self.scheduler.call_every(millis, callback)
+
+    def _next_event_millis(self):
+        waits = [self.network.next_delivery_millis(), self.scheduler.next_timeout_millis()]
+        waits += [endpoint.next_timeout_millis() for endpoint in self._endpoints.values()]
+        waits = [w for w in waits if w is not None]
+        return min(waits) if waits else None
+
+    def _step(self):
+        for sock in self.network.deliver_due():
+            endpoint = self._endpoints.get(sock)
+            if endpoint is not None:
+                endpoint.on_readable()
+        for endpoint in self._endpoints.values():
+            if endpoint.next_timeout_millis() == 0:
+                endpoint.handle_timers()
+        self.scheduler.run_due()
+
+    def run_until(self, end_millis):
+        steps = 0
+        while True:
+            self._step()
+            wait = self._next_event_millis()
+            if wait == 0:
+                steps += 1
+                assert steps < self._MAX_STEPS_PER_INSTANT, "Simulation isn't progressing"
+                continue
+            steps = 0
+            if wait is None or self.clock() + wait > end_millis:
+                self.clock.advance_to(end_millis)
+                self._step()
+                return
+            self.clock.advance(wait)
+
+    def run_for(self, millis):
+        self.run_until(self.clock() + millis)
+
+
+def sender_args(log, sock, receiver_addr, **overrides):
+    """Sender args as from sender_args_base, without building a profile"""
+    args = dict(logger=log,
+                sock=sock,
+                receiver_ip_port=receiver_addr,
+                lookout_timeout_seconds=10,
+                resend_same_countdown_seconds=0.5,
+                new_connection_id_countdown_seconds=10,
+                last_received_timer_seconds=45)
+    args.update(overrides)
+    return types.SimpleNamespace(**args)
+
+
+def receiver_args(log, sock, score_writer, **overrides):
+    """Receiver args as from receiver_args_mark2, without building a profile"""
+    args = dict(logger=log,
+                sock=sock,
+                score_writer=score_writer,
+                lookout_timeout_seconds=20,
+                sender_arbitration="freshness",
+                sender_priorities=[],
+                sender_session_timeout_seconds=60)
+    args.update(overrides)
+    return types.SimpleNamespace(**args)
+
+
+def match_timeline(*, hours=6, seed=0, mean_score_interval_seconds=30):
+    """List of (millis, score) for a match: play starting after 5 seconds and
+    runs being scored on average every mean_score_interval_seconds"""
+    score_random = random.Random(seed)
+    timeline = []
+    runs = 0
+    millis = 5000
+    while millis < hours * 3600 * 1000:
+        runs += score_random.choice((1, 1, 2, 4, 6))
+        timeline.append((millis, int_to_bytes(runs % 1000, 3) + bytes(Packet.PAYLOAD_SIZE - 3)))
+        millis += score_random.expovariate(1 / mean_score_interval_seconds) * 1000
+    return timeline
+
+
+def simulate_match(log,
+                   *,
+                   hours=6,
+                   impairment="perfect",
+                   seed=0,
+                   timeline=None,
+                   sender_overrides=None,
+                   receiver_overrides=None):
+    """One sender and one receiver for a match of hours, the sender reading
+    each score in timeline (see match_timeline) at its time. Returns a
+    namespace of the timeline, display writes as (millis, score) and the
+    network's link stats."""
+    if timeline is None:
+        timeline = match_timeline(hours=hours, seed=seed)
+    # The connection ids come from the global random, so seed it for the run
+    # and put it back afterwards for anything else in the process using it
+    random_state = random.getstate()
+    random.seed(seed)
+    try:
+        return _simulate_match(log, hours, impairment, seed, timeline, sender_overrides or {},
+                               receiver_overrides or {})
+    finally:
+        random.setstate(random_state)
+
+
+def _simulate_match(log, hours, impairment, seed, timeline, sender_overrides,
+                    receiver_overrides):
+    clock = VirtualClock()
+    network = InMemoryNetwork(clock, impairment, seed)
+    sender_addr, receiver_addr = ("10.0.0.2", 2521), ("10.0.0.1", 2520)
+
+    writes = []
+    receiver_sock = network.socket(receiver_addr)
+    receiver = _Receiver(receiver_args(log, receiver_sock,
+                                       lambda score: writes.append((clock(), score)),
+                                       **receiver_overrides),
+                         time_now=clock)
+    sender_sock = network.socket(sender_addr)
+    sender = Sender(sender_args(log, sender_sock, receiver_addr, **sender_overrides),
+                    time_now=clock)
+
+    simulation = Simulation(network)
+    simulation.add(receiver_sock, receiver)
+    simulation.add(sender_sock, sender)
+
+    # The sender comes up with an empty score, then play starts
+    sender.update_score(bytes(Packet.PAYLOAD_SIZE))
+    for millis, score in timeline:
+        simulation.call_later(millis, lambda score=score: sender.update_score(score))
+    simulation.run_for(hours * 3600 * 1000)
+
+    return types.SimpleNamespace(timeline=timeline,
+                                 writes=writes,
+                                 connected=sender.is_connected(),
+                                 link_stats={
+                                     "sender_to_receiver":
+                                     network.channel(sender_addr, receiver_addr).stats,
+                                     "receiver_to_sender":
+                                     network.channel(receiver_addr, sender_addr).stats
+                                 })
+
+
+def main(argv):
+    from cricket_scorer.misc import my_logger
+
+    hours = float(argv[1]) if len(argv) > 1 else 6
+    impairment = argv[2] if len(argv) > 2 else "bad_wifi"
+
+    log = my_logger.get_logger()
+    log.setLevel(logging.WARNING)
+
+    clock = VirtualClock()
+    network = InMemoryNetwork(clock)
+    a, b = network.socket(("a", 1)), network.socket(("b", 2))
+    a.sendto(b"hi", ("b", 2))
+    assert b.recvfrom(2, timeout_ms=0) == (b"hi", ("a", 1))
+    assert b.recvfrom(2, timeout_ms=500) == (None, None) and clock() == 500
+
+    start = time.perf_counter()
+    result = simulate_match(log, hours=hours, impairment=impairment, seed=1)
+    elapsed = time.perf_counter() - start
+    print(f"{hours} hours over {impairment} in {elapsed:.2f}s: {len(result.timeline)} score "
+          f"changes, {len(result.writes)} display writes, connected {result.connected}")
+    print(result.link_stats)
+    assert result.writes[-1][1] == result.timeline[-1][1], "Display didn't end up with the score"
+
+    random_state = random.getstate()
+    again = simulate_match(log, hours=0.5, impairment=impairment, seed=1)
+    assert again.writes == simulate_match(log, hours=0.5, impairment=impairment, seed=1).writes
+    assert random.getstate() == random_state, "The global random was left seeded"
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
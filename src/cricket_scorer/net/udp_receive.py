@@ -2,10 +2,14 @@ import select
 import socket
 
 import cricket_scorer.misc.my_platform as my_platform
+from cricket_scorer.misc import metrics
+from cricket_scorer.misc.my_logger import Lazy
+
+_WRONG_SIZE_DROPS = metrics.REGISTRY.counter("wrong_size_drops")
 
 
 def _bytes_to_hex_string(b: bytes):
-    assert isinstance(b, bytes)
+    assert isinstance(b, (bytes, bytearray, memoryview))
     return f"bytes ({len(b)}) 0x: [" + \
         " ".join(["{:02x}".format(x) for x in b]) + "]"
 
@@ -21,7 +25,7 @@ class SimpleUDP:
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if any(exc_type, exc_value, traceback):
+        if any((exc_type, exc_value, traceback)):
             self._log.debug(f"Error closing SimpleUDP {exc_type} {exc_value} " f"{traceback}")
         self.close()
 
@@ -29,6 +33,15 @@ class SimpleUDP:
         self._log.debug(f"Closing socket id:{id(self)} {self._sock}")
         self._sock.close()
 
+    def socket(self):
+        """The underlying (bound, non-blocking) socket, eg. to hand to
+        asyncio's create_datagram_endpoint"""
+        return self._sock
+
+    def fileno(self):
+        """So this can be registered with selectors/an EventLoop directly"""
+        return self._sock.fileno()
+
     def __init__(self, log, server_port, host_ip_bind="0.0.0.0"):
         self._log = log
         self._log.debug(f"SimpleUDP socket constructing id:{id(self)}, " f"on port:{server_port}")
@@ -42,6 +55,41 @@ class SimpleUDP:
         self._sock.bind(server_addr)
         self._sock.setblocking(False)
 
+        # Preallocated buffer for recvfrom_view, see _get_recv_buffer
+        self._recv_buffer = bytearray()
+        self._recv_view = memoryview(self._recv_buffer)
+
+    def _get_recv_buffer(self, num_bytes):
+        # One byte larger than expected so oversized datagrams (which
+        # recvfrom_into silently truncates on Linux) are seen as the wrong size
+        if len(self._recv_buffer) != num_bytes + 1:
+            self._recv_buffer = bytearray(num_bytes + 1)
+            self._recv_view = memoryview(self._recv_buffer)
+        return self._recv_view
+
+    def _log_recv_error(self, e):
+        err_string = str(e)
+        if my_platform.IS_WINDOWS and e.errno == 10054:
+            err_string += " - (very) likely can ignore IF testing on localhost"
+        self._log.warning("udp_receive recv error:", err_string)
+
+    def _check_recv_size(self, data, num_bytes, addr):
+        self._log.debug("Recvd:", Lazy(_bytes_to_hex_string, data), "from", addr)
+        if len(data) != num_bytes:
+            _WRONG_SIZE_DROPS.inc()
+            self._log.warning("Discarding message as received incorrect "
+                              "number of bytes, expected", num_bytes, "but got", len(data), ":",
+                              bytes(data), addr)
+            return False
+        return True
+
+    def wait_readable(self, *, timeout_ms):
+        """Block until there is data to read or the timeout expires. Returns
+        whether the socket is readable"""
+        assert timeout_ms >= 0
+        r, _, _ = select.select([self._sock], [], [], timeout_ms / 1000)
+        return self._sock in r
+
     def recvfrom(self, num_bytes, *, timeout_ms=50):
         """If data available to read, returns (data, addr)
         Else returns (None, None) after the timeout expires
@@ -51,30 +99,74 @@ class SimpleUDP:
         if self._sock in r:
             try:
                 data, addr = self._sock.recvfrom(num_bytes)
-                self._log.debug(f"Recvd: {_bytes_to_hex_string(data)} from {addr}")
-                if len(data) != num_bytes:
-                    self._log.warning(
-                        "Discarding message as received incorrect "
-                        "number of bytes, expected", num_bytes, "but got", len(data), ":", data,
-                        addr)
-                if len(data) == num_bytes:
+                if self._check_recv_size(data, num_bytes, addr):
                     return data, addr
             except OSError as e:
-                err_string = str(e)
-                if my_platform.IS_WINDOWS and e.errno == 10054:
-                    err_string += " - (very) likely can ignore IF testing on localhost"
-                self._log.warning("udp_receive recv error:", err_string)
+                self._log_recv_error(e)
         return None, None
 
-    def sendto(self, data, addr):
-        assert type(data) is bytes
-        _, w, _ = select.select([], [self._sock], [], 0)
-        if self._sock in w:
+    def recvfrom_view(self, num_bytes, *, timeout_ms=50):
+        """As recvfrom, but reads into a preallocated buffer with recvfrom_into
+        and returns (memoryview, addr) without allocating per datagram.
+
+        The memoryview is only valid until the next receive on this socket, so
+        decode (copy out of) it before then.
+        """
+        assert num_bytes > 0, timeout_ms >= 0
+        r, _, _ = select.select([self._sock], [], [], timeout_ms / 1000)
+        if self._sock in r:
+            view = self._get_recv_buffer(num_bytes)
             try:
-                self._log.debug(f"Sending {_bytes_to_hex_string(data)} to {addr}")
-                sent = self._sock.sendto(data, addr)
-                if sent == len(data):
-                    return True
+                n, addr = self._sock.recvfrom_into(view)
+                if self._check_recv_size(view[:n], num_bytes, addr):
+                    return view[:n], addr
             except OSError as e:
-                self._log.warning(f"udp_receive.send error, sending to addr: {addr}: {e}")
+                self._log_recv_error(e)
+        return None, None
+
+    def drain(self, num_bytes, *, max_datagrams=None):
+        """Generator reading every datagram already queued on the socket without
+        blocking (or selecting), stopping when the socket would block
+        (EAGAIN/EWOULDBLOCK) or after max_datagrams reads if given.
+
+        A connection reset/refused error only reports an ICMP error for an
+        earlier send, so reading carries on after one. Any other error is
+        logged and stops the drain, rather than retrying it forever.
+
+        Yields (memoryview, addr) pairs as recvfrom_view does, each only valid
+        until the next is requested. Wrongly sized datagrams are discarded.
+        """
+        assert num_bytes > 0
+        assert max_datagrams is None or max_datagrams > 0
+        view = self._get_recv_buffer(num_bytes)
+        reads = 0
+        while max_datagrams is None or reads < max_datagrams:
+            reads += 1
+            try:
+                n, addr = self._sock.recvfrom_into(view)
+            except BlockingIOError:
+                return
+            except (ConnectionResetError, ConnectionRefusedError) as e:
+                self._log_recv_error(e)
+                continue
+            except OSError as e:
+                self._log_recv_error(e)
+                return
+            if self._check_recv_size(view[:n], num_bytes, addr):
+                yield view[:n], addr
+
+    def sendto(self, data, addr):
+        """data may be any bytes-like object, eg. a reused bytearray
+
+        The socket is non-blocking so there's no need to select for
+        writability first, a full send buffer fails the send as it would have
+        """
+        assert isinstance(data, (bytes, bytearray, memoryview))
+        try:
+            self._log.debug("Sending", Lazy(_bytes_to_hex_string, data), "to", addr)
+            sent = self._sock.sendto(data, addr)
+            if sent == len(data):
+                return True
+        except OSError as e:
+            self._log.warning(f"udp_receive.send error, sending to addr: {addr}: {e}")
         return False
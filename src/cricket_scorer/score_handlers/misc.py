@@ -1,5 +1,6 @@
 import time
 
+from cricket_scorer.misc.profiling import PROFILER
 from cricket_scorer.net.packet import Packet
 from cricket_scorer.net.utility import int_to_bytes
 from cricket_scorer.score_handlers.scoredata import ScoreData
@@ -17,6 +18,7 @@ class ScoreGenerator:
     def refresh_excel(self, *args, **kwargs):
         pass
 
+    @PROFILER.profile()
     def read_score(self):
         if time.time() - self._time > self.change_every_seconds:
             # if random.random() >= 0.8:
@@ -34,5 +36,6 @@ class ScorePrinter:
     def __init__(self, *args):
         pass
 
+    @PROFILER.profile()
     def __call__(self, score):
         print("New score received:", score)
@@ -1,9 +1,12 @@
 import copy
 import itertools
+import re
 import sys
 
 from cricket_scorer.net.packet import Packet
+import cricket_scorer.score_handlers.scoredata
 import cricket_scorer.score_handlers.utils
+from cricket_scorer.misc.profiling import PROFILER
 
 from dataclasses import dataclass
 
@@ -29,6 +32,51 @@ DEFAULT_CELLS = {
 }
 
 
+_CELL_ADDRESS = re.compile(r"^\$?([A-Za-z]{1,3})\$?([0-9]+)$")
+
+# Larger than this and the cells are read one by one rather than as a block
+_MAX_BLOCK_CELLS = 256
+
+
+def parse_cell(address):
+    """(row, column) from 1 of an A1 style address, None if it isn't one (eg.
+    it's a named range)"""
+    match = _CELL_ADDRESS.match(address.strip())
+    if match is None:
+        return None
+    column = 0
+    for letter in match.group(1).upper():
+        column = column * 26 + ord(letter) - ord("A") + 1
+    return int(match.group(2)), column
+
+
+def _column_letters(column):
+    letters = ""
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def block_for_cells(addresses):
+    """Plans reading the cells in one go: returns the address of the smallest
+    block containing them all, eg. "A2:D2", and each cell's (row, column)
+    offset in it, or None if they should be read one by one
+
+    A block rather than a union range (eg. "A2,C5"), as through COM the value
+    of a union range is only that of its first area.
+    """
+    cells = [parse_cell(address) for address in addresses]
+    if not cells or None in cells:
+        return None
+    top, bottom = min(r for r, _ in cells), max(r for r, _ in cells)
+    left, right = min(c for _, c in cells), max(c for _, c in cells)
+    if (bottom - top + 1) * (right - left + 1) > _MAX_BLOCK_CELLS:
+        return None
+    block = f"{_column_letters(left)}{top}:{_column_letters(right)}{bottom}"
+    return block, [(r - top, c - left) for r, c in cells]
+
+
 def _serialise_score(size, n):
     try:
         n = str(int(n)).zfill(size)
@@ -69,12 +117,13 @@ class ScoreReaderExcel:
             self._cells[key].cell = val
         self._log.debug("Spreadsheet wrapper - done refreshing")
 
+    @PROFILER.profile()
     def read_score(self):
         assert SERIALISATION_ORDER == list(self._cells.keys())
         unparsable_score_names = []
-        for score_name, score_data in self._cells.items():
-            cell_data = self._spreadsheet.read_cell_value(score_data)
-
+        # One round trip to Excel for all the cells
+        values = self._spreadsheet.read_cells([d.cell for d in self._cells.values()])
+        for (score_name, score_data), cell_data in zip(self._cells.items(), values):
             # Only update the score value if it is serialisable ie. valid
             if _serialise_score(score_data.digits, cell_data) is None:
                 unparsable_score_names.append(score_name)
@@ -98,3 +147,27 @@ class ScoreReaderExcel:
         if self._spreadsheet is not None:
             self._spreadsheet.close()
         self._running = False
+
+
+def main(argv):
+    from cricket_scorer.misc import my_logger
+    from . import score_reader_excel_dummy
+
+    assert block_for_cells(["A2", "B2", "C2", "D2"]) == ("A2:D2", [(0, 0), (0, 1), (0, 2),
+                                                                      (0, 3)])
+    assert block_for_cells(["$B$3", "a1", "AA1"]) == ("A1:AA3", [(2, 1), (0, 0), (0, 26)])
+    assert block_for_cells(["A1", "Total"]) is None
+    assert block_for_cells(["A1", "Z1000"]) is None
+    assert _column_letters(27) == "AA" and parse_cell("AA1") == (1, 27)
+
+    reader = score_reader_excel_dummy.get_score_reader(my_logger.get_logger())
+    reader.refresh_excel("dummy.xlsx", "Sheet1", "A2", "B2", "C2", "D2")
+    reader._spreadsheet.set_cells({"A2": 123, "B2": 4, "C2": "x", "D2": 56})
+    score = reader.read_score()
+    print(score)
+    assert list(score.score) == [1, 2, 3, 4, 0, 0, 0, 5, 6] and "overs" in score.error_msg
+    assert reader._spreadsheet.round_trips == 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,589 @@
+import xml.etree.ElementTree as ET
+
+import posixpath
+import struct
+import sys
+import zipfile
+
+from cricket_scorer.misc import file_watcher, metrics
+from . import score_reader_excel_impl
+
+# Reads the score cells straight from the workbook file on disk, so no Excel
+# (or xlwings, or Windows) is needed. Both legacy .xls files (BIFF8 records in
+# an OLE2 compound file, Excel 97 onwards) and .xlsx files (zipped xml) are
+# read, told apart by their first bytes rather than the extension.
+#
+# Only what's saved is seen: Excel has to save the workbook for a change to
+# show. The file's only decoded again when its stat_key changes, and then only
+# the worksheet holding the cells (plus shared strings, if a cell's one).
+#
+# Values are as xlwings gives them: numbers are floats, empty and error cells
+# None, then text and bools.
+
+_DECODES = metrics.REGISTRY.counter("workbook_decodes")
+
+_OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_ZIP_MAGIC = b"PK\x03\x04"
+
+
+def read_workbook_cells(path, worksheet, addresses):
+    """Values of the cells (A1 style addresses) on worksheet, in order"""
+    cells = [score_reader_excel_impl.parse_cell(address) for address in addresses]
+    if None in cells:
+        raise ValueError(f"Only cell addresses like B3 can be read from the file, not "
+                         f"{addresses[cells.index(None)]!r}")
+    # Both formats number rows and columns from 0
+    wanted = {(row - 1, column - 1) for row, column in cells}
+    with open(path, "rb") as f:
+        magic = f.read(8)
+        f.seek(0)
+        if magic == _OLE2_MAGIC:
+            values = _read_xls_cells(f.read(), worksheet, wanted)
+        elif magic.startswith(_ZIP_MAGIC):
+            with zipfile.ZipFile(f) as z:
+                values = _read_xlsx_cells(z, worksheet, wanted)
+        else:
+            raise ValueError(f"{path} isn't an .xls or .xlsx workbook")
+    _DECODES.inc()
+    return [values.get((row - 1, column - 1)) for row, column in cells]
+
+
+def _find_sheet(names, worksheet):
+    """Index of worksheet in names, which like in Excel is case insensitive"""
+    for i, name in enumerate(names):
+        if name.casefold() == worksheet.casefold():
+            return i
+    raise ValueError(f"No worksheet {worksheet!r} in the workbook, it has {names}")
+
+
+# OLE2 compound file, see [MS-CFB]
+
+_MAX_REG_SECT = 0xFFFFFFFA
+
+
+class _CompoundFile:
+    """The streams in an OLE2 compound file"""
+    def __init__(self, data):
+        self._data = data
+        self._sector_size = 1 << struct.unpack_from("<H", data, 0x1E)[0]
+        self._mini_sector_size = 1 << struct.unpack_from("<H", data, 0x20)[0]
+        (num_fat_sectors, first_directory_sector, _, self._mini_cutoff, first_minifat_sector,
+         _, first_difat_sector, num_difat_sectors) = struct.unpack_from("<8I", data, 0x2C)
+
+        # The first 109 FAT sector numbers are in the header, any more in a
+        # chain of DIFAT sectors whose last entry is the next one's number
+        fat_sectors = list(struct.unpack_from("<109I", data, 0x4C))
+        per_sector = self._sector_size // 4
+        sector = first_difat_sector
+        for _ in range(num_difat_sectors):
+            if sector > _MAX_REG_SECT:
+                break
+            entries = struct.unpack_from(f"<{per_sector}I", data, self._offset(sector))
+            fat_sectors += entries[:-1]
+            sector = entries[-1]
+        self._fat = []
+        for sector in fat_sectors[:num_fat_sectors]:
+            self._fat += struct.unpack_from(f"<{per_sector}I", data, self._offset(sector))
+
+        directory = self._read_chain(first_directory_sector, self._fat, self._sector_size,
+                                     self._sector_stream)
+        # name -> (start sector, size)
+        self._entries = {}
+        root = None
+        for offset in range(0, len(directory) - 127, 128):
+            name_bytes, = struct.unpack_from("<H", directory, offset + 64)
+            kind = directory[offset + 66]
+            start, size = struct.unpack_from("<II", directory, offset + 116)
+            if kind == 5:
+                root = (start, size)
+            elif kind == 2:
+                name = bytes(directory[offset:offset + max(name_bytes - 2, 0)])
+                self._entries[name.decode("utf-16-le").casefold()] = (start, size)
+        if root is None:
+            raise ValueError("Compound file has no root entry")
+
+        # Streams smaller than the cutoff are in the mini stream, which is the
+        # root entry's stream, in mini sectors chained by the mini FAT
+        self._mini_stream = self._read_chain(root[0], self._fat, self._sector_size,
+                                             self._sector_stream)[:root[1]]
+        minifat = self._read_chain(first_minifat_sector, self._fat, self._sector_size,
+                                   self._sector_stream)
+        self._minifat = struct.unpack_from(f"<{len(minifat) // 4}I", minifat)
+
+    def _offset(self, sector):
+        # The header takes up the first sector
+        return (sector + 1) * self._sector_size
+
+    def _sector_stream(self, sector):
+        offset = self._offset(sector)
+        return self._data[offset:offset + self._sector_size]
+
+    def _mini_sector_stream(self, sector):
+        offset = sector * self._mini_sector_size
+        return self._mini_stream[offset:offset + self._mini_sector_size]
+
+    @staticmethod
+    def _read_chain(sector, fat, sector_size, read_sector):
+        chunks = []
+        # A chain can't be longer than the table, this catches loops
+        for _ in range(len(fat) + 1):
+            if sector > _MAX_REG_SECT:
+                return b"".join(chunks)
+            if sector >= len(fat):
+                raise ValueError(f"Compound file sector {sector} out of range")
+            chunks.append(read_sector(sector))
+            sector = fat[sector]
+        raise ValueError("Compound file has a loop in a sector chain")
+
+    def stream(self, name):
+        """The named stream, or None if there isn't one"""
+        entry = self._entries.get(name.casefold())
+        if entry is None:
+            return None
+        start, size = entry
+        if size < self._mini_cutoff:
+            data = self._read_chain(start, self._minifat, self._mini_sector_size,
+                                    self._mini_sector_stream)
+        else:
+            data = self._read_chain(start, self._fat, self._sector_size, self._sector_stream)
+        return data[:size]
+
+
+# BIFF8 records, see [MS-XLS]
+
+_BOF = 0x0809
+_EOF = 0x000A
+_FILEPASS = 0x002F
+_BOUNDSHEET = 0x0085
+_SST = 0x00FC
+_CONTINUE = 0x003C
+_FORMULA = 0x0006
+_NUMBER = 0x0203
+_RK = 0x027E
+_MULRK = 0x00BD
+_LABELSST = 0x00FD
+_LABEL = 0x0204
+_BOOLERR = 0x0205
+_STRING = 0x0207
+_BIFF8 = 0x0600
+
+
+def _records(data, offset=0):
+    """(type, data) of each record from offset"""
+    while offset + 4 <= len(data):
+        kind, length = struct.unpack_from("<HH", data, offset)
+        yield kind, data[offset + 4:offset + 4 + length]
+        offset += 4 + length
+
+
+class _ContinuedReader:
+    """Reads across a record and the CONTINUE records after it. Where a
+    string's characters are split between records, the next starts with a
+    new flags byte saying whether they're one or two bytes each."""
+    def __init__(self, segments):
+        self._segments = segments
+        self._i = 0
+        self._pos = 0
+
+    def read(self, n):
+        out = bytearray()
+        while len(out) < n:
+            segment = self._segments[self._i]
+            if self._pos == len(segment):
+                self._next()
+                continue
+            take = min(n - len(out), len(segment) - self._pos)
+            out += segment[self._pos:self._pos + take]
+            self._pos += take
+        return bytes(out)
+
+    def _next(self):
+        self._i += 1
+        self._pos = 0
+        if self._i == len(self._segments):
+            raise ValueError("Shared strings run past their records")
+
+    def read_string(self):
+        """An XLUnicodeRichExtendedString"""
+        count, flags = struct.unpack("<HB", self.read(3))
+        runs = struct.unpack("<H", self.read(2))[0] if flags & 0x8 else 0
+        extra = struct.unpack("<I", self.read(4))[0] if flags & 0x4 else 0
+        wide = flags & 0x1
+        parts = []
+        while count:
+            segment = self._segments[self._i]
+            if self._pos == len(segment):
+                self._next()
+                wide = self.read(1)[0] & 0x1
+                continue
+            width = 2 if wide else 1
+            n = min(count, (len(segment) - self._pos) // width)
+            if n == 0:
+                raise ValueError("Shared string character split across records")
+            chars = segment[self._pos:self._pos + n * width]
+            parts.append(bytes(chars).decode("utf-16-le" if wide else "latin-1"))
+            self._pos += n * width
+            count -= n
+        self.read(4 * runs + extra)
+        return "".join(parts)
+
+
+def _read_shared_strings(segments, last_index):
+    """The SST's strings up to last_index"""
+    reader = _ContinuedReader(segments)
+    _, unique = struct.unpack("<II", reader.read(8))
+    return [reader.read_string() for _ in range(min(unique, last_index + 1))]
+
+
+def _unicode_string(data, offset, length_bytes):
+    """An XLUnicodeString (length_bytes 2) or ShortXLUnicodeString (1) at
+    offset"""
+    count = data[offset] if length_bytes == 1 else struct.unpack_from("<H", data, offset)[0]
+    offset += length_bytes
+    wide = data[offset] & 0x1
+    offset += 1
+    if wide:
+        return bytes(data[offset:offset + 2 * count]).decode("utf-16-le")
+    return bytes(data[offset:offset + count]).decode("latin-1")
+
+
+def _rk_value(rk):
+    if rk & 0x2:
+        value = (rk - (1 << 32) if rk & 0x80000000 else rk) >> 2
+    else:
+        value = struct.unpack("<d", struct.pack("<Q", (rk & 0xFFFFFFFC) << 32))[0]
+    return value / 100 if rk & 0x1 else float(value)
+
+
+def _read_xls_cells(data, worksheet, wanted):
+    compound = _CompoundFile(data)
+    stream = compound.stream("Workbook")
+    if stream is None:
+        if compound.stream("Book") is not None:
+            raise ValueError("Workbook is from before Excel 97, save it as a newer .xls")
+        raise ValueError("Compound file has no Workbook stream")
+    stream = memoryview(stream)
+
+    # Workbook globals: the sheets and where their records start, and the
+    # shared strings, only decoded if a cell wanted is one
+    sheets = []
+    sst = None
+    previous = None
+    for kind, record in _records(stream):
+        if kind == _BOF:
+            if struct.unpack_from("<H", record)[0] != _BIFF8:
+                raise ValueError("Workbook is from before Excel 97, save it as a newer .xls")
+        elif kind == _FILEPASS:
+            raise ValueError("Workbook is password protected")
+        elif kind == _BOUNDSHEET:
+            sheets.append((_unicode_string(record, 6, 1), struct.unpack_from("<I", record)[0]))
+        elif kind == _SST:
+            sst = [record]
+        elif kind == _CONTINUE and previous in (_SST, _CONTINUE) and sst is not None:
+            sst.append(record)
+            continue
+        elif kind == _EOF:
+            break
+        previous = kind
+
+    _, sheet_offset = sheets[_find_sheet([name for name, _ in sheets], worksheet)]
+    values = {}
+    string_indices = {}
+    formula_string = None
+    for kind, record in _records(stream, sheet_offset):
+        if kind == _EOF:
+            break
+        if kind == _STRING and formula_string is not None:
+            values[formula_string] = _unicode_string(record, 0, 2)
+            formula_string = None
+            continue
+        if kind not in (_FORMULA, _NUMBER, _RK, _MULRK, _LABELSST, _LABEL, _BOOLERR):
+            continue
+        row, column = struct.unpack_from("<HH", record)
+        if kind == _MULRK:
+            # xf and RK value for each column from column to the last
+            for i in range((len(record) - 6) // 6):
+                if (row, column + i) in wanted:
+                    rk, = struct.unpack_from("<I", record, 6 + 6 * i)
+                    values[(row, column + i)] = _rk_value(rk)
+            continue
+        if (row, column) not in wanted:
+            continue
+        if kind == _NUMBER:
+            values[(row, column)] = struct.unpack_from("<d", record, 6)[0]
+        elif kind == _RK:
+            values[(row, column)] = _rk_value(struct.unpack_from("<I", record, 6)[0])
+        elif kind == _LABELSST:
+            string_indices[(row, column)] = struct.unpack_from("<I", record, 6)[0]
+        elif kind == _LABEL:
+            values[(row, column)] = _unicode_string(record, 6, 2)
+        elif kind == _BOOLERR:
+            value, is_error = struct.unpack_from("<BB", record, 6)
+            values[(row, column)] = None if is_error else bool(value)
+        elif kind == _FORMULA:
+            # The cached result: a float, unless the top two bytes are 0xFFFF
+            # when the first byte says what it is
+            if struct.unpack_from("<H", record, 12)[0] != 0xFFFF:
+                values[(row, column)] = struct.unpack_from("<d", record, 6)[0]
+            elif record[6] == 0:
+                # A string, in the STRING record that follows
+                formula_string = (row, column)
+            elif record[6] == 1:
+                values[(row, column)] = bool(record[8])
+            elif record[6] == 3:
+                values[(row, column)] = ""
+        if len(values) + len(string_indices) == len(wanted) and formula_string is None:
+            break
+
+    if string_indices:
+        if sst is None:
+            raise ValueError("Workbook has cells of shared strings but no shared strings")
+        strings = _read_shared_strings(sst, max(string_indices.values()))
+        for cell, index in string_indices.items():
+            values[cell] = strings[index] if index < len(strings) else None
+    return values
+
+
+# Office Open XML, see ECMA-376. Tags and attributes are matched on their
+# local names, so transitional and strict files both read.
+
+
+def _local(name):
+    return name.rsplit("}", 1)[-1]
+
+
+def _relationships(z, part):
+    """Relationship type (its last path segment) -> target part of part"""
+    folder, name = posixpath.split(part)
+    rels_part = posixpath.join(folder, "_rels", name + ".rels")
+    targets = {}
+    ids = {}
+    with z.open(rels_part) as f:
+        for e in ET.parse(f).getroot():
+            target = e.get("Target")
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(folder, target))
+            targets.setdefault(e.get("Type").rsplit("/", 1)[-1], target)
+            ids[e.get("Id")] = target
+    return targets, ids
+
+
+def _column_number(letters):
+    column = 0
+    for letter in letters:
+        column = column * 26 + ord(letter) - ord("A") + 1
+    return column
+
+
+def _cell_position(reference):
+    """(row, column) from 0 of a cell reference like B3"""
+    digits = len(reference.rstrip("0123456789"))
+    return int(reference[digits:]) - 1, _column_number(reference[:digits]) - 1
+
+
+def _read_xlsx_cells(z, worksheet, wanted):
+    workbook_part = _relationships(z, "")[0]["officeDocument"]
+    with z.open(workbook_part) as f:
+        sheet_elements = [e for e in ET.parse(f).getroot().iter() if _local(e.tag) == "sheet"]
+    names = [e.get("name") for e in sheet_elements]
+    sheet = sheet_elements[_find_sheet(names, worksheet)]
+    rel_id = next(v for k, v in sheet.attrib.items() if _local(k) == "id")
+    targets, ids = _relationships(z, workbook_part)
+
+    values = {}
+    string_indices = {}
+    last_row = max(row for row, _ in wanted)
+    row = column = -1
+    with z.open(ids[rel_id]) as f:
+        for event, e in ET.iterparse(f, events=("start", "end")):
+            tag = _local(e.tag)
+            if event == "start":
+                if tag == "row":
+                    row = int(e.get("r", row + 2)) - 1
+                    column = -1
+                    # Rows are in order, so the rest can't be wanted
+                    if row > last_row:
+                        break
+                continue
+            if tag == "row":
+                e.clear()
+            if tag != "c":
+                continue
+            reference = e.get("r")
+            column = _cell_position(reference)[1] if reference else column + 1
+            if (row, column) in wanted:
+                kind = e.get("t", "n")
+                v = next((c.text for c in e if _local(c.tag) == "v"), None)
+                if kind == "s":
+                    string_indices[(row, column)] = int(v)
+                elif kind == "inlineStr":
+                    values[(row, column)] = "".join(
+                        t.text or "" for c in e if _local(c.tag) == "is" for t in c.iter()
+                        if _local(t.tag) == "t")
+                elif kind == "b":
+                    values[(row, column)] = v == "1"
+                elif kind in ("str", "d"):
+                    values[(row, column)] = v or ""
+                elif kind == "n" and v is not None:
+                    values[(row, column)] = float(v)
+                # Else an error, or empty, so None
+                if len(values) + len(string_indices) == len(wanted):
+                    break
+
+    if string_indices:
+        values.update(zip(string_indices, _read_xlsx_shared_strings(
+            z, targets.get("sharedStrings"), string_indices.values())))
+    return values
+
+
+def _read_xlsx_shared_strings(z, part, indices):
+    """The shared strings at each of indices"""
+    if part is None:
+        raise ValueError("Workbook has cells of shared strings but no shared strings")
+    last_index = max(indices)
+    strings = []
+    with z.open(part) as f:
+        for _, e in ET.iterparse(f):
+            if _local(e.tag) != "si":
+                continue
+            # Plain text is in one t, rich text in a t per run. Phonetic
+            # readings (rPh) aren't part of the text.
+            strings.append("".join(t.text or "" for child in e if _local(child.tag) != "rPh"
+                                   for t in child.iter() if _local(t.tag) == "t"))
+            e.clear()
+            if len(strings) > last_index:
+                break
+    return [strings[i] if i < len(strings) else None for i in indices]
+
+
+class SpreadsheetWrapperNative:
+    """Reads the spreadsheet file itself, see the top of this file"""
+    def __init__(self):
+        self._path = None
+        self._worksheet = None
+        self._cache_key = None
+        self._cached_values = None
+
+    def reinit(self, log, spreadsheet_path, worksheet):
+        log.debug(f"Reading spreadsheet file at {spreadsheet_path}")
+        self._path = spreadsheet_path
+        self._worksheet = worksheet
+        self._cache_key = None
+        self._cached_values = None
+
+    def read_cell_value(self, cell_score_data):
+        return self.read_cells([cell_score_data.cell])[0]
+
+    def read_cells(self, addresses):
+        stat_key = file_watcher.stat_key(self._path)
+        key = (stat_key, tuple(addresses))
+        if stat_key is not None and key == self._cache_key:
+            return list(self._cached_values)
+        try:
+            values = read_workbook_cells(self._path, self._worksheet, addresses)
+        except Exception as e:
+            raise RuntimeError(
+                f"Error reading cell data from spreadsheet file. Have you checked things like "
+                f"the worksheet name is correct? Original error: {e}")
+        # If it changed while being read, it's read again next time
+        if file_watcher.stat_key(self._path) == stat_key:
+            self._cache_key = key
+            self._cached_values = values
+        return list(values)
+
+    def close(self):
+        pass
+
+
+def get_score_reader(logger):
+    """Returns an Excel score reader that reads the spreadsheet file directly"""
+    return score_reader_excel_impl.ScoreReaderExcel(SpreadsheetWrapperNative, logger)
+
+
+def main(argv):
+    import os
+    import tempfile
+
+    from cricket_scorer.misc import my_logger
+
+    assert _rk_value(0x02F1AA00 << 2 | 0x2) == 0x02F1AA00
+    assert _rk_value(0x3FF00000 << 32 >> 32) == 1.0
+    assert _rk_value((4711 << 2) | 0x3) == 47.11
+    assert _rk_value(((-5) & 0x3FFFFFFF) << 2 | 0x2) == -5
+
+    # The second string's split across records, going to two bytes a char
+    sst = [struct.pack("<II", 2, 2) + b"\x02\x00\x00ab\x04\x00\x00cd", b"\x01" + "é€".encode(
+        "utf-16-le")]
+    assert _read_shared_strings(sst, 1) == ["ab", "cdé€"]
+    assert _read_shared_strings(sst, 0) == ["ab"]
+
+    xls = argv[1] if len(argv) > 1 else os.path.join(os.path.dirname(__file__), "..", "..", "..",
+                                                   "input_examples", "score.xls")
+    values = read_workbook_cells(xls, "Score", ["A1", "A2", "B2", "C2", "D2", "IV65536"])
+    print(os.path.basename(xls), values)
+    assert values == [None, 1, 2, 3, 4, None], values
+    reader = get_score_reader(my_logger.get_logger())
+    reader.refresh_excel(xls, "score", "A2", "B2", "C2", "D2")
+    assert list(reader.read_score().score) == [0, 0, 1, 2, 0, 3, 0, 0, 4]
+
+    # Shared strings and numbers, rich text and a row without r
+    parts = {
+        "[Content_Types].xml": "<Types/>",
+        "_rels/.rels":
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+        "xl/workbook.xml":
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+        '<sheet name="Other" sheetId="1" r:id="rId1"/><sheet name="Sheet1" sheetId="2" '
+        'r:id="rId2"/></sheets></workbook>',
+        "xl/_rels/workbook.xml.rels":
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships/worksheet" Target="worksheets/sheet1.xml"/><Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="/xl/worksheets/sheet2.xml"/><Relationship Id="rId3" Type="http://schemas.'
+        'openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+        'Target="sharedStrings.xml"/></Relationships>',
+        "xl/worksheets/sheet1.xml": "not read",
+        "xl/worksheets/sheet2.xml":
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<sheetData><row r="1"><c r="A1" t="s"><v>1</v></c><c r="B1" t="inlineStr"><is><t>'
+        'in</t></is></c></row><row r="2"><c r="A2"><v>123</v></c><c r="B2" t="s"><v>0</v></c>'
+        '<c r="C2" t="e"><v>#DIV/0!</v></c><c r="D2"><f>A2</f><v>56</v></c></row><row>'
+        '<c t="b"><v>1</v></c></row><row r="9"><c r="A9"><v>9</v></c></row></sheetData>'
+        '</worksheet>',
+        "xl/sharedStrings.xml":
+        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><si><t>four'
+        '</t></si><si><r><t>ri</t></r><r><t>ch</t></r><rPh><t>x</t></rPh></si></sst>',
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        xlsx = os.path.join(folder, "score.xlsx")
+        with zipfile.ZipFile(xlsx, "w") as z:
+            for name, text in parts.items():
+                z.writestr(name, text)
+        values = read_workbook_cells(xlsx, "SHEET1", ["A1", "B1", "A2", "B2", "C2", "D2", "A3"])
+        assert values == ["rich", "in", 123, "four", None, 56, True], values
+
+        reader.refresh_excel(xlsx, "Sheet1", "A2", "A3", "C4", "D2")
+        score = reader.read_score()
+        print(score)
+        # Overs is empty so stays as read from the .xls
+        assert list(score.score) == [1, 2, 3, 1, 0, 3, 0, 5, 6], score
+        decodes = _DECODES.value
+        reader.read_score()
+        assert _DECODES.value == decodes, "Unchanged file was decoded again"
+
+        reader.refresh_excel(xlsx, "Missing", "A2", "A3", "C4", "D2")
+        try:
+            reader.read_score()
+            assert False
+        except RuntimeError as e:
+            assert "Missing" in str(e)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -3,6 +3,7 @@ from functools import partial
 from smbus2 import SMBus
 
 from cricket_scorer.score_handlers.scoredata import ScoreData
+from cricket_scorer.misc.profiling import PROFILER
 from . import utils
 
 
@@ -21,6 +22,7 @@ class ScoreReaderI2c:
         self.write_byte = partial(utils.write_byte_safe, self._bus, self._log)
         self.read_byte = partial(utils.read_byte_else, self._bus, self._log)
 
+    @PROFILER.profile()
     def read_score(self):
         results = []
         for mux, chan in self._mux_channels:
@@ -1,32 +1,125 @@
 import xml.etree.ElementTree as ET
 
 import dataclasses
+import io
 import itertools
 import typing
 
+from cricket_scorer.misc import file_watcher, metrics
+from cricket_scorer.misc.profiling import PROFILER
+from cricket_scorer.net.countdown_timer import monotonic_millis
 from cricket_scorer.score_handlers.scoredata import ScoreData
 # from . import utils
 
+_TORN_READS = metrics.REGISTRY.counter("xml_torn_reads")
+
+# The scoring software rewrites the file in place, so it may be read part
+# written. What it's written so far is never a complete document, ie. ending
+# with the root's end tag.
+_ROOT_END_TAG = b"</nvplay>"
+
 
 def get_score_reader(logger):
     return ScoreReaderXml(logger)
 
 
 class ScoreReaderXml:
-    def __init__(self, log):
+    """Reads the score from an NVPlay xml export
+
+    If the file's caught part way through being written, the last score read
+    is returned marked stale. The file isn't read again until it changes or
+    a retry delay (doubling per torn read, from _MIN_RETRY_MILLIS to
+    _MAX_RETRY_MILLIS) has passed, so a writer that's stopped part way isn't
+    re-read in a hot loop.
+    """
+
+    _MIN_RETRY_MILLIS = 10
+    _MAX_RETRY_MILLIS = 500
+
+    def __init__(self, log, time_now=monotonic_millis):
         self._log = log
+        self._time_now = time_now
         self._filepath = None
+        # The file is only parsed again when its stat_key changes, as
+        # read_score is called as often as every few ms
+        self._cache_key = None
+        self._cached_score = None
+        self._watcher = None
+        self._reset_retry()
+
+    def _reset_retry(self):
+        # stat_key of the file when it was last found torn
+        self._torn_key = None
+        self._retry_millis = 0
+        self._retry_at = None
 
     def refresh_xml(self, xml_path):
         self._filepath = xml_path
+        self._cache_key = None
+        self._cached_score = None
+        self._reset_retry()
+        self._close_watcher()
+
+    def watch(self):
+        """Returns a file_watcher for the xml file, whose changed() says when
+        to read_score. It's closed by refresh_xml and close."""
+        assert self._filepath is not None
+        self._close_watcher()
+        self._watcher = file_watcher.make_file_watcher(self._filepath, self._log)
+        return self._watcher
+
+    def _close_watcher(self):
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
 
+    @PROFILER.profile()
     def read_score(self) -> ScoreData:
         assert self._filepath is not None
-        score = read_scores_from_xml(self._filepath)
+        key = file_watcher.stat_key(self._filepath)
+        if key is not None and key == self._cache_key:
+            return ScoreData(score=self._cached_score)
+        if self._torn_key is not None and key == self._torn_key \
+                and self._time_now() < self._retry_at:
+            return self._stale_score()
+
+        self._log.debug("Xml file changed, parsing", self._filepath)
+        score = self._read_complete(key)
+        if score is None:
+            _TORN_READS.inc()
+            self._torn_key = key
+            self._retry_millis = min(max(self._retry_millis * 2, self._MIN_RETRY_MILLIS),
+                                     self._MAX_RETRY_MILLIS)
+            self._retry_at = self._time_now() + self._retry_millis
+            self._log.debug("Xml file", self._filepath, "is part written, retrying in",
+                            self._retry_millis, "ms")
+            return self._stale_score()
+
+        self._reset_retry()
+        self._cached_score = score
+        self._cache_key = key
         return ScoreData(score=score)
 
+    def _read_complete(self, key):
+        """The score, or None if the file's part written"""
+        with open(self._filepath, "rb") as f:
+            data = f.read()
+        if file_watcher.stat_key(self._filepath) != key \
+                or not data.rstrip().endswith(_ROOT_END_TAG):
+            return None
+        try:
+            return read_scores_from_xml_bytes(data)
+        except ET.ParseError:
+            return None
+
+    def _stale_score(self):
+        if self._cached_score is None:
+            raise ValueError(f"Xml file {self._filepath} is part written, and there's no "
+                             "earlier score to use")
+        return ScoreData(score=self._cached_score, stale=True)
+
     def close(self):
-        pass
+        self._close_watcher()
 
 
 @dataclasses.dataclass
@@ -49,10 +142,10 @@ def parse_int_else_zero(text):
         return 0
 
 
-def _read_scores_from_xml(filepath) -> CricketGameScore:
+def _read_scores_from_xml(f) -> CricketGameScore:
+    """f is a binary file object"""
     scores = CricketGameScore()
-    with open(filepath, "r") as f:
-        tree = ET.parse(f)
+    tree = ET.parse(f)
     root = tree.getroot()
     scoreboard = root.find("scoreboard")
     for e in scoreboard.findall("field"):
@@ -67,8 +160,60 @@ def _read_scores_from_xml(filepath) -> CricketGameScore:
     return scores
 
 
-def read_scores_from_xml(path) -> bytes:
-    scores = _read_scores_from_xml(path)
+# NVPlay field key -> the CricketGameScore attribute it's read into
+_FIELD_SLOTS = {
+    "InningsRuns": "runs",
+    "InningsWickets": "wickets",
+    "InningsCompletedOvers": "overs",
+    "FirstInningsScore": "first_innings",
+}
+
+
+def _stream_scores_from_xml(f, chunk_bytes=2048) -> CricketGameScore:
+    """As _read_scores_from_xml, but parsing chunk_bytes at a time, discarding
+    each field once read and stopping as soon as all of _FIELD_SLOTS are
+    found (or the scoreboard ends). Any not found are None."""
+    scores = CricketGameScore()
+    for slot in _FIELD_SLOTS.values():
+        setattr(scores, slot, None)
+    remaining = set(_FIELD_SLOTS)
+    # Only end events, so each element's text is complete and there's half
+    # as many events as with start events too
+    parser = ET.XMLPullParser(events=("end", ))
+    while remaining:
+        data = f.read(chunk_bytes)
+        if not data:
+            break
+        parser.feed(data)
+        for _, e in parser.read_events():
+            if e.tag == "field":
+                key = e.get("key")
+                if key in remaining:
+                    setattr(scores, _FIELD_SLOTS[key], parse_int_else_zero(e.text))
+                    remaining.discard(key)
+                e.clear()
+            elif e.tag == "scoreboard":
+                remaining.clear()
+            if not remaining:
+                break
+    return scores
+
+
+def read_scores_from_xml(path, streaming=False) -> bytes:
+    """streaming chooses _stream_scores_from_xml over _read_scores_from_xml.
+    On the NVPlay exports in input_examples they benchmark the same (see
+    benchmarks/suite.py), as expat's parsing is most of the cost and
+    FirstInningsScore is near the end, so it isn't the default."""
+    with open(path, "rb") as f:
+        return _scores_from_xml_file(f, streaming)
+
+
+def read_scores_from_xml_bytes(data, streaming=False) -> bytes:
+    return _scores_from_xml_file(io.BytesIO(data), streaming)
+
+
+def _scores_from_xml_file(f, streaming) -> bytes:
+    scores = _stream_scores_from_xml(f) if streaming else _read_scores_from_xml(f)
     # Order is total (runs), wickets, overs, (1st) innings
     # Digits 3, 1, 2, 3 => 9 bytes
     # TODO: proper abstraction for this so it isn't duplicated everywhere
@@ -1,5 +1,6 @@
 from smbus2 import SMBus
 
+from cricket_scorer.misc.profiling import PROFILER
 from . import utils
 
 
@@ -25,6 +26,7 @@ class ScoreWriterI2cMark1:
         muxes = [0x4, 0x5, 0x6]
         self._addrs_muxes = [(a, m) for a in addrs for m in muxes]
 
+    @PROFILER.profile()
     def __call__(self, score, blank_out_leading_zeroes=True):
         score = utils.sanitise_received_score(self._log, score, len(self._addrs_muxes),
                                               blank_out_leading_zeroes)
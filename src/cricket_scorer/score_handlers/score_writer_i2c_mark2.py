@@ -3,6 +3,7 @@ from functools import partial
 
 from smbus2 import SMBus
 
+from cricket_scorer.misc.profiling import PROFILER
 from . import utils
 
 
@@ -106,6 +107,7 @@ class ScoreWriterI2cMark2:
             else:
                 self.flip(addr, score)
 
+    @PROFILER.profile()
     def __call__(self, score):
         self._set_score(score)
 
@@ -3,6 +3,7 @@ import time
 from smbus2 import SMBus
 
 from . import utils
+from cricket_scorer.misc.profiling import PROFILER
 from cricket_scorer.net.packet import Packet
 
 
@@ -20,6 +21,7 @@ class ScoreWriterI2cSingleDigit:
             utils.write_byte_safe(self._bus, self._log, self._addr, utils.INT_TO_DISPLAY[v])
             time.sleep(0.75)
 
+    @PROFILER.profile()
     def __call__(self, score):
         assert self._addr_index >= 0 and self._addr_index < len(score)
 
@@ -5,9 +5,14 @@ from cricket_scorer.net.packet import Packet
 
 @dataclass
 class ScoreData:
-    """Holds the score in bytes and a string error message which may be empty"""
+    """Holds the score in bytes and a string error message which may be empty
+
+    stale is set if the score couldn't be read just now (eg. the file was
+    part written) so this is the last one that could be
+    """
     score: bytes = bytes(Packet.PAYLOAD_SIZE)
     error_msg: str = ""
+    stale: bool = False
 
     def score_as_str(self):
         return Packet.payload_as_string(self.score)
@@ -16,7 +21,8 @@ class ScoreData:
         # Must have brackets here, otherwise precedence of operators means
         # this doesn't behave how it is intended
         return Packet.payload_as_string(self.score) \
-            + (", error: " + self.error_msg if self.error_msg else "")
+            + (", error: " + self.error_msg if self.error_msg else "") \
+            + (" (stale)" if self.stale else "")
 
 
 # class ScoreData:
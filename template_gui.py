@@ -12,7 +12,6 @@ import pathlib
 import platform
 import sys
 import textwrap
-import time
 import traceback
 import types
 import typing
@@ -23,9 +22,10 @@ import plyer
 
 from cricket_scorer.misc import my_logger, profiles
 from cricket_scorer.misc.params import Args
+from cricket_scorer.misc.profiling import PROFILER
 from cricket_scorer.misc.profiles import RECEIVER_WIFI_SSID, RECEIVER_WIFI_PASSWORD
 from cricket_scorer.net import connection
-from cricket_scorer.net.countdown_timer import make_countdown_timer
+from cricket_scorer.net.countdown_timer import Scheduler, make_countdown_timer
 from cricket_scorer.score_handlers.scoredata import ScoreData
 
 # class OnlyPrintOnDiff:
@@ -46,39 +46,6 @@ from cricket_scorer.score_handlers.scoredata import ScoreData
 #         self.buf = io.StringIO()
 
 
-class BetterTimer:
-    """Grouping of timers by name to measure restartable performance timing of
-    segments of code
-    """
-
-    def __init__(self) -> None:
-        self._timers = {}
-
-    # def restart(self):
-    #     self._timers.clear()
-
-    def start(self, name):
-        total, started = self._timers.setdefault(name, (0, -1))
-        assert started == -1, "Must be stopped before starting"
-        self._timers[name] = (total, time.time())
-
-    def stop(self, name):
-        assert name in self._timers
-        total, started = self._timers.get(name)
-        assert started != -1, "Must be started before stopped"
-        total += time.time() - started
-        self._timers[name] = (total, -1)
-
-    def running(self, name):
-        return name in self._timers and self._timers[name][1] != -1
-
-    def summary(self):
-        for k in self._timers:
-            if self.running(k):
-                self.stop(k)
-        return [f"{name} -> {t}" for name, (t, _) in self._timers.items()]
-
-
 class MyLogFilter(logging.Filter):
     """Log filter attached to the handler for the logs tab in the GUI. The
     setLevel method is called to change the level that is displayed.
@@ -586,7 +553,8 @@ def main():
     ]
 
     state = types.SimpleNamespace(
-        timer=BetterTimer(),
+        # Where the time goes in the main loop, logged on exit
+        timer=PROFILER,
         settings=settings,
         saved_settings=saved_settings,
         running_settings={},
@@ -598,17 +566,24 @@ def main():
         lost_connection_notifications=False,
         just_lost_connection=False,
         lost_connection_timer=make_countdown_timer(seconds=30, started=False),
-        sender_connection=typing.Union[None, connection.Sender],
+        sender_connection=typing.Union[None, connection.Sender, connection.FanOutSender],
         consecutive_reader_errors=0,
         reader_timer=make_countdown_timer(seconds=3, started=False),
+        # For readers of a file, says when it's been written so it's read
+        # straight away rather than at the next reader_timer
+        reader_watcher=None,
+        # Writes out the packet journal, if the profile has one
+        journal_sync=None,
         logs_folder_toggle=settings["logs_folder_toggle"],
-        spinning_char_timer=make_countdown_timer(seconds=2),
+        # Callbacks for things that only need doing every so often, called
+        # from the main loop when due
+        scheduler=Scheduler(),
         spinning_char_index=0,
         general_error_flag=False,
-        general_error_flag_timer=make_countdown_timer(
-            seconds=15, started=False),
+        general_error_flag_call=None,
         desktop_error_notifications=True,
     )
+    PROFILER.enable()
 
     def _send_desktop_notification(title, message, log, app_name, app_icon, timeout=10):
         assert isinstance(app_icon, str)
@@ -782,7 +757,8 @@ def setup_args_impl(log, sender_profiles, state):
     state.timer.start("init sender connection")
     try:
         log.info("Initialising sender connection")
-        state.sender_connection = connection.Sender(args)
+        state.sender_connection = connection.make_sender(args)
+        state.journal_sync = connection.schedule_journal_sync(args, state.scheduler)
     except Exception as e:
         log_error(f"Error from sender_connection setup: {e}")
         return args, False
@@ -803,6 +779,7 @@ def setup_args_impl(log, sender_profiles, state):
                                             state.settings["innings"])
         elif hasattr(args.score_reader, "refresh_xml"):
             args.score_reader.refresh_xml(state.settings["spreadsheet_path"])
+            state.reader_watcher = args.score_reader.watch()
 
     except Exception as e:
         log_error(
@@ -838,6 +815,7 @@ class MyLogHandler(logging.StreamHandler):
         self._log_func(self, record)
 
 
+@PROFILER.profile("log widget")
 def print_to_output(handler, record: logging.LogRecord, window, key, state,
                     send_desktop_notification):
     background_color = None
@@ -850,7 +828,10 @@ def print_to_output(handler, record: logging.LogRecord, window, key, state,
             send_desktop_notification("cricket_scorer error",
                                       "An error has occurred, check the logs tab")
         state.general_error_flag = True
-        state.general_error_flag_timer.reset()
+        if state.general_error_flag_call is not None:
+            state.general_error_flag_call.cancel()
+        state.general_error_flag_call = state.scheduler.call_later(
+            15000, lambda: clear_general_error_flag(window, state))
         window["general_error_message"].update("Error (check the logs tab for more info)",
                                                visible=True)
     window[key].update(value=handler.formatter.format(record) + "\n",
@@ -858,6 +839,20 @@ def print_to_output(handler, record: logging.LogRecord, window, key, state,
                        append=True)
 
 
+def clear_general_error_flag(window, state):
+    state.general_error_flag = False
+    state.general_error_flag_call = None
+    window["general_error_message"].update(visible=False)
+
+
+def advance_spinning_char(window, state):
+    """Spinner to show we haven't frozen"""
+    spinning_chars = ["|", "/", "-", "\\"]
+    state.spinning_char_index += 1
+    state.spinning_char_index %= len(spinning_chars)
+    window["spinning_char"].update(spinning_chars[state.spinning_char_index])
+
+
 def save_settings(log, user_settings_file, state):
     s = "\n" + "\n".join(f"{k}: {v}" for k, v in state.settings.items())
     log.debug(f"Saving settings to {user_settings_file.get_filename()}", s)
@@ -964,6 +959,10 @@ def stop_running(state):
     state.sender_connection = None
     state.consecutive_reader_errors = 0
     state.reader_timer.reset()
+    state.reader_watcher = None
+    if state.journal_sync is not None:
+        state.journal_sync.cancel()
+        state.journal_sync = None
     # if args is not None:
     #     args.close()
 
@@ -1006,6 +1005,8 @@ def gui_main_loop(log: my_logger.LogWrapper, sender_profiles, window: sg.Window,
     if test_show:
         window["general_error_message"].update(visible=True)
 
+    state.scheduler.call_every(2000, lambda: advance_spinning_char(window, state))
+
     state.timer.start("loop")
     while not state.done:
         event, values = window.read(10)
@@ -1033,9 +1034,8 @@ def gui_main_loop(log: my_logger.LogWrapper, sender_profiles, window: sg.Window,
             # insane when selecting files to test and this overwrites it. For
             # live this is fine as only xml_live or excel_live should ever be
             # selected
-            # Also this breaks on Ubuntu as the excel_live profile is only
-            # loaded on Windows (as you won't be able to open Excel on Linux).
-            # Again this only matters for testing.
+            # Off Windows excel_live reads the saved spreadsheet file itself,
+            # see score_reader_excel_native.
 
             i = 0
             profiles = window["profile"].get_list_values()
@@ -1099,7 +1099,8 @@ def gui_main_loop(log: my_logger.LogWrapper, sender_profiles, window: sg.Window,
 
         # If running, read the score from Excel
         state.timer.start("reader")
-        if state.running and state.reader_timer.just_expired():
+        if state.running and (state.reader_timer.just_expired() or
+                              (state.reader_watcher is not None and state.reader_watcher.changed())):
             state.reader_timer.reset()
             assert args is not None, "If state.running, args should not be None"
             try:
@@ -1144,8 +1145,18 @@ def gui_main_loop(log: my_logger.LogWrapper, sender_profiles, window: sg.Window,
             if not state.connected:
                 log.info("Connected!")
             state.connected = True
-            window["is_connected"].update(
-                "Connected    ", **status_text_format_ok)
+            # With several receivers, show how many are connected and only
+            # show as ok if they all are
+            statuses = state.sender_connection.connection_statuses()
+            num_connected = sum(statuses.values())
+            if len(statuses) > 1:
+                window["is_connected"].update(
+                    f"Connected {num_connected}/{len(statuses)}",
+                    **(status_text_format_ok
+                       if num_connected == len(statuses) else status_text_format_warning))
+            else:
+                window["is_connected"].update(
+                    "Connected    ", **status_text_format_ok)
         else:
             window["is_connected"].update(
                 "Not connected", **status_text_format_warning)
@@ -1185,20 +1196,10 @@ def gui_main_loop(log: my_logger.LogWrapper, sender_profiles, window: sg.Window,
         else:
             window["settings_changed"].update(visible=False)
 
-        # Spinner to show we haven't frozen
-        spinning_chars = ["|", "/", "-", "\\"]
-        if state.spinning_char_timer.just_expired():
-            state.spinning_char_timer.reset()
-            state.spinning_char_index += 1
-            state.spinning_char_index %= len(spinning_chars)
-            window["spinning_char"].update(
-                spinning_chars[state.spinning_char_index])
-
-        if state.general_error_flag_timer.just_expired():
-            state.general_error_flag = False
-            state.general_error_flag_timer.reset()
-            if not test_show:
-                window["general_error_message"].update(visible=False)
+        # Spinner and clearing the error flag
+        state.scheduler.run_due()
+        if test_show:
+            window["general_error_message"].update(visible=True)
 
         # printer.print_contents_if_diff()
 